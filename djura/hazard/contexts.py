@@ -0,0 +1,574 @@
+from functools import partial
+from typing import List
+import re
+import numpy as np
+from scipy.special import ndtr, ndtri
+from openquake.baselib.general import DictArray
+from openquake.hazardlib.cross_correlation import BakerJayaram2008
+from openquake.hazardlib.imt import from_string
+
+from djura.hazard.dstore import LazyContext, _get_probs_occur_matrix
+from djura.utilities import map_jobs
+
+
+def get_disaggregation_from_contexts(
+    ctx: dict,
+    imls: List[float],
+    im_ref: str = None,
+    mag_bin_width: float = 0.5,
+    dist_bin_width: float = 10.0,
+    dist_metric: str = 'rrup',
+    chunk_size: int = 10_000
+) -> dict:
+    """
+    Computes the exact disaggregation of a site from its rupture contexts.
+
+    The GSIMs of each group (source model) are evaluated through the context
+    makers of the datastore for the conditioning IMT `im_ref`, which does
+    not have to be one of the IMTs of the hazard calculation. The
+    probabilities of exceeding each IML are obtained for all ruptures and
+    IMLs at once, with the truncated normal distribution of the GSIMs, and
+    combined with the occurrence probabilities of the ruptures. The
+    ruptures are processed in chunks of `chunk_size` to bound the memory.
+
+    Parameters
+    ----------
+    ctx : dict
+        Output of `djura.hazard.dstore.get_context_from_dstore` for a single
+        site.
+    imls : List[float]
+        Intensity measure levels of the disaggregation, in ascending order.
+    im_ref : str, optional
+        Conditioning IMT, by default `ctx['im_ref']`.
+    mag_bin_width : float, optional
+        Width of the magnitude bins, by default 0.5.
+    dist_bin_width : float, optional
+        Width of the distance bins in km, by default 10.0.
+    dist_metric : str, optional
+        Distance parameter of the contexts used for binning, by default
+        'rrup'.
+    chunk_size : int, optional
+        Number of ruptures evaluated at once, by default 10000.
+
+    Returns
+    -------
+    dict
+        A dictionary with the following keys:
+            - 'imt': Conditioning IMT.
+            - 'imls': Intensity measure levels.
+            - 'poes': Probabilities of exceedance of the IMLs in the
+            investigation time, recomputed from the contexts.
+            - 'ruptures': Contributions of each rupture of `ctx['ruptures']`,
+            with shape (IMLs, ruptures):
+                - 'gamma': Probability of exceedance caused by the rupture.
+                - 'hz_cont_exc': Normalised exceedance contribution.
+                - 'hz_cont_occ': Normalised occurrence contribution.
+            - 'mag_dist': Binned magnitude-distance disaggregation, with the
+            magnitude ('mag') and distance ('dist') of each bin, the
+            contributions 'gamma', 'hz_cont_exc' and 'hz_cont_occ' with shape
+            (IMLs, bins), and the 'mean_mags', 'mean_dists', 'mod_mags' and
+            'mod_dists' of each IML.
+
+    Notes
+    -----
+    - The contributions are averaged over the GSIMs of each group with the
+      weights of the logic tree realizations using them.
+    - The occurrence contribution of an IML is that of the IM falling
+      between the IML and the next one, the last IML is open-ended
+      (Fox et al. 2016).
+    - Poissonian occurrence rates are recovered from the occurrence
+      probabilities `probs` of the ruptures.
+    """
+    im_ref = ctx['im_ref'] if im_ref is None else im_ref
+    imls = np.asarray(imls, dtype=float)
+    ruptures = ctx['ruptures']
+    if isinstance(ruptures, LazyContext):
+        ruptures = ruptures.to_recarray()
+    weights = np.asarray(ctx['lt-weights'], dtype=float)
+
+    # Magnitude-distance bin of each rupture
+    mags = np.asarray(ruptures.mag, dtype=float)
+    dists = np.asarray(ruptures[dist_metric], dtype=float)
+    mag_idx = np.floor(mags / mag_bin_width).astype(int)
+    dist_idx = np.floor(dists / dist_bin_width).astype(int)
+    mag_start = mag_idx.min(initial=0)
+    mag_idx -= mag_start
+    n_mags = mag_idx.max(initial=-1) + 1
+    n_dists = dist_idx.max(initial=-1) + 1
+    bins = mag_idx * n_dists + dist_idx
+    n_bins = n_mags * n_dists
+
+    gamma = np.empty((len(imls), len(ruptures)))
+    log_pnes = {}
+    for grp_id, start, stop, cmaker, pnes in _iter_pnes(
+            ctx, ruptures, im_ref, imls, chunk_size):
+        # Logic tree weight of each GSIM of the group
+        gsim_weights = _get_gsim_weights(cmaker, weights)
+        gamma[:, start:stop] = np.einsum(
+            'g,gnl->ln', gsim_weights, 1 - pnes)
+
+        if grp_id not in log_pnes:
+            log_pnes[grp_id] = 0
+        log_pnes[grp_id] = log_pnes[grp_id] + np.log(pnes).sum(axis=1)
+
+    poes = _get_mean_poes(ctx, log_pnes, weights, len(imls))
+
+    # Occurrence between each IML and the next one
+    gamma_occ = gamma - np.r_[gamma[1:], np.zeros((1, len(ruptures)))]
+
+    # Binned contributions of all IMLs at once
+    flat = (np.arange(len(imls))[:, None] * n_bins + bins).ravel()
+    gamma_bins = np.bincount(flat, weights=gamma.ravel(),
+                             minlength=len(imls) * n_bins)
+    gamma_bins = gamma_bins.reshape(len(imls), n_bins)
+    gamma_occ_bins = np.bincount(flat, weights=gamma_occ.ravel(),
+                                 minlength=len(imls) * n_bins)
+    gamma_occ_bins = gamma_occ_bins.reshape(len(imls), n_bins)
+
+    bin_mags = (np.repeat(np.arange(n_mags), n_dists) + mag_start + 0.5) * \
+        mag_bin_width
+    bin_dists = (np.tile(np.arange(n_dists), n_mags) + 0.5) * dist_bin_width
+
+    hz_cont_exc_bins = _normalise(gamma_bins)
+    mode = np.argmax(hz_cont_exc_bins, axis=1) if n_bins else []
+
+    return {
+        'imt': im_ref,
+        'imls': imls,
+        'poes': poes,
+        'ruptures': {
+            'gamma': gamma,
+            'hz_cont_exc': _normalise(gamma),
+            'hz_cont_occ': _normalise(gamma_occ),
+        },
+        'mag_dist': {
+            'mag': bin_mags,
+            'dist': bin_dists,
+            'gamma': gamma_bins,
+            'hz_cont_exc': hz_cont_exc_bins,
+            'hz_cont_occ': _normalise(gamma_occ_bins),
+            'mean_mags': hz_cont_exc_bins @ bin_mags,
+            'mean_dists': hz_cont_exc_bins @ bin_dists,
+            'mod_mags': bin_mags[mode],
+            'mod_dists': bin_dists[mode],
+        },
+    }
+
+
+def get_hazard_curve_from_contexts(
+    ctx: dict,
+    im_ref: str = None,
+    imls: List[float] = None,
+    chunk_size: int = 10_000,
+    n_jobs: int = None
+) -> dict:
+    """
+    Recomputes the mean hazard curve of a site from its rupture contexts.
+
+    The probabilities of no exceedance of the ruptures are obtained as in
+    `get_disaggregation_from_contexts` and combined by group (source model)
+    and logic tree realization into the mean hazard curve. The groups can
+    be processed by a pool of worker processes.
+
+    Parameters
+    ----------
+    ctx : dict
+        Output of `djura.hazard.dstore.get_context_from_dstore` for a single
+        site.
+    im_ref : str, optional
+        IMT of the hazard curve, by default `ctx['im_ref']`.
+    imls : List[float], optional
+        Intensity measure levels, by default the levels of `im_ref` in the
+        hazard calculation.
+    chunk_size : int, optional
+        Number of ruptures evaluated at once, by default 10000.
+    n_jobs : int, optional
+        Number of worker processes over the groups. If None or 1, the groups
+        are processed serially.
+
+    Returns
+    -------
+    dict
+        A dictionary with the IMT ('imt'), the intensity measure levels
+        ('imls') and their probabilities of exceedance in the investigation
+        time ('poes').
+    """
+    im_ref = ctx['im_ref'] if im_ref is None else im_ref
+    imls = ctx['imt'][im_ref] if imls is None else imls
+    imls = np.asarray(imls, dtype=float)
+    ruptures = ctx['ruptures']
+    if isinstance(ruptures, LazyContext):
+        ruptures = ruptures.to_recarray()
+
+    grp_ids = list(ctx['grp-ids'])
+    offsets = ctx['grp-offsets']
+    items = [(ruptures[start:stop], ctx['cmakers'][grp_id])
+             for grp_id, start, stop in zip(grp_ids, offsets[:-1],
+                                            offsets[1:])]
+    log_pnes = map_jobs(
+        partial(_get_group_log_pnes, im_ref, imls, chunk_size), items,
+        n_jobs)
+
+    weights = np.asarray(ctx['lt-weights'], dtype=float)
+    poes = _get_mean_poes(ctx, dict(zip(grp_ids, log_pnes)), weights,
+                          len(imls))
+
+    return {
+        'imt': im_ref,
+        'imls': imls,
+        'poes': poes,
+    }
+
+
+def check_hazard_curve(
+    ctx: dict,
+    im_ref: str = None,
+    rtol: float = 0.01,
+    min_poe: float = 1e-8,
+    chunk_size: int = 10_000,
+    n_jobs: int = None
+) -> dict:
+    """
+    Compares the hazard curve recomputed from the rupture contexts of a site
+    with the hazard curve stored in the datastore.
+
+    This is a fast validation of the extracted contexts, e.g. after keeping
+    only the top `n_rups` ruptures, without running the engine. The curve
+    is recomputed at the IMLs of the hazard calculation with
+    `get_hazard_curve_from_contexts`.
+
+    Parameters
+    ----------
+    ctx : dict
+        Output of `djura.hazard.dstore.get_context_from_dstore` for a single
+        site.
+    im_ref : str, optional
+        IMT of the hazard curve, by default `ctx['im_ref']`.
+    rtol : float, optional
+        Relative tolerance on the probabilities of exceedance, by default
+        0.01.
+    min_poe : float, optional
+        Stored probabilities of exceedance below this value are ignored in
+        the relative discrepancy, by default 1e-8.
+    chunk_size : int, optional
+        Number of ruptures evaluated at once, by default 10000.
+    n_jobs : int, optional
+        Number of worker processes over the groups. If None or 1, the groups
+        are processed serially.
+
+    Returns
+    -------
+    dict
+        A dictionary with the following keys:
+            - 'imt': IMT of the hazard curve.
+            - 'imls': Intensity measure levels.
+            - 'poes': Recomputed probabilities of exceedance.
+            - 'stored-poes': Probabilities of exceedance of the datastore.
+            - 'abs-diff': Absolute discrepancy at each IML.
+            - 'rel-diff': Relative discrepancy at each IML, NaN below
+            `min_poe`.
+            - 'max-abs-diff': Maximum absolute discrepancy.
+            - 'max-rel-diff': Maximum relative discrepancy.
+            - 'consistent': Whether the maximum relative discrepancy is
+            within `rtol`.
+    """
+    im_ref = ctx['im_ref'] if im_ref is None else im_ref
+    curve = get_hazard_curve_from_contexts(
+        ctx, im_ref, chunk_size=chunk_size, n_jobs=n_jobs)
+
+    # Stored curves with shape (sites, 1, IMTs, IMLs)
+    imt_idx = list(ctx['imt']).index(im_ref)
+    stored = np.asarray(ctx['hazard-curves'])[ctx['site-id'], 0, imt_idx]
+
+    abs_diff = np.abs(curve['poes'] - stored)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rel_diff = np.where(stored >= min_poe, abs_diff / stored, np.nan)
+    max_rel_diff = np.nanmax(rel_diff, initial=0.)
+
+    return {
+        **curve,
+        'stored-poes': stored,
+        'abs-diff': abs_diff,
+        'rel-diff': rel_diff,
+        'max-abs-diff': abs_diff.max(initial=0.),
+        'max-rel-diff': max_rel_diff,
+        'consistent': bool(max_rel_diff <= rtol),
+    }
+
+
+def get_cms_from_contexts(
+    ctx: dict,
+    imts: List[str],
+    imls: List[float],
+    im_ref: str = None,
+    correlation=None,
+    chunk_size: int = 10_000
+) -> dict:
+    """
+    Computes conditional mean spectrum (CMS) targets of a site from its
+    rupture contexts.
+
+    For every rupture, GSIM and conditioning IML at once, the GSIMs are
+    evaluated for the IMTs of the spectrum and for the conditioning IMT, and
+    the conditional means and standard deviations are obtained from the
+    epsilon of the conditioning IML and the correlation between the IMTs.
+    They are aggregated, for each conditioning IML, as a mixture weighted by
+    the contribution of each rupture and GSIM to the occurrence of the
+    conditioning IML, i.e., the occurrence probability `probs` of the
+    rupture, the logic tree weight of the GSIM and the probability density
+    of the conditioning IML (Lin et al. 2013). The ruptures are processed in
+    chunks of `chunk_size` to bound the memory.
+
+    Parameters
+    ----------
+    ctx : dict
+        Output of `djura.hazard.dstore.get_context_from_dstore` for a single
+        site, e.g. with the top `n_rups` ruptures.
+    imts : List[str]
+        IMTs of the spectrum, e.g. ``['SA(0.1)', 'SA(0.2)', 'SA(0.5)']``.
+    imls : List[float]
+        Conditioning IMLs, e.g. one for each PoE from the `cond_imls` of
+        `djura.hazard.psha.proc_oq_hazard_curve`.
+    im_ref : str, optional
+        Conditioning IMT, by default `ctx['im_ref']`.
+    correlation : openquake.hazardlib.cross_correlation.CrossCorrelation,
+        optional
+        Correlation model between the IMTs, by default BakerJayaram2008.
+    chunk_size : int, optional
+        Number of ruptures evaluated at once, by default 10000.
+
+    Returns
+    -------
+    dict
+        A dictionary with the following keys:
+            - 'imts': IMTs of the spectrum.
+            - 'imls': Conditioning IMLs.
+            - 'mean': Conditional mean of the logarithm of the IMTs, with
+            shape (IMLs, IMTs).
+            - 'std': Conditional standard deviation of the logarithm of the
+            IMTs, with shape (IMLs, IMTs).
+            - 'rupture-weights': Normalised contribution of each rupture of
+            `ctx['ruptures']`, with shape (IMLs, ruptures).
+            - 'rupture-mean': Conditional mean of each rupture, over its
+            GSIMs, with shape (IMLs, ruptures, IMTs).
+            - 'rupture-std': Conditional standard deviation of each rupture,
+            over its GSIMs, with shape (IMLs, ruptures, IMTs).
+    """
+    im_ref = ctx['im_ref'] if im_ref is None else im_ref
+    correlation = BakerJayaram2008() if correlation is None else correlation
+    log_imls = np.log(np.asarray(imls, dtype=float))
+    ruptures = ctx['ruptures']
+    if isinstance(ruptures, LazyContext):
+        ruptures = ruptures.to_recarray()
+    weights = np.asarray(ctx['lt-weights'], dtype=float)
+
+    rho = np.array([
+        correlation.get_correlation(
+            from_string(_to_oq_imt(im_ref)), from_string(_to_oq_imt(imt)))
+        for imt in imts])
+
+    n_imls, n_imts, n_rups = len(log_imls), len(imts), len(ruptures)
+    rup_weights = np.zeros((n_imls, n_rups))
+    rup_mean = np.zeros((n_imls, n_rups, n_imts))
+    rup_moment = np.zeros((n_imls, n_rups, n_imts))
+
+    for grp_id, start, stop in zip(ctx['grp-ids'], ctx['grp-offsets'][:-1],
+                                   ctx['grp-offsets'][1:]):
+        cmaker = ctx['cmakers'][grp_id]
+        gsim_weights = _get_gsim_weights(cmaker, weights)
+        truncation = ndtri(cmaker.phi_b)
+        for chunk_start in range(start, stop, chunk_size):
+            rows = slice(chunk_start, min(chunk_start + chunk_size, stop))
+            chunk = ruptures[rows]
+
+            # (GSIMs, IMTs, ruptures), the conditioning IMT last
+            mean, sig = _get_mean_stds(chunk, cmaker, [*imts, im_ref])
+            mean_ref, sig_ref = mean[:, -1], sig[:, -1]
+            mean, sig = mean[:, :-1], sig[:, :-1]
+
+            # (IMLs, GSIMs, ruptures)
+            eps = (log_imls[:, None, None] - mean_ref) / sig_ref
+            density = np.exp(-eps ** 2 / 2) / sig_ref
+            density[np.abs(eps) > truncation] = 0.
+            weight = density * gsim_weights[:, None] * \
+                np.asarray(chunk.probs, dtype=float)
+
+            # (IMLs, GSIMs, ruptures, IMTs)
+            cond_mean = mean.transpose(0, 2, 1) + \
+                (rho * sig.transpose(0, 2, 1)) * eps[..., None]
+            cond_var = (sig.transpose(0, 2, 1) ** 2) * (1 - rho ** 2)
+
+            rup_weights[:, rows] = weight.sum(axis=1)
+            rup_mean[:, rows] = np.einsum('pgn,pgni->pni', weight, cond_mean)
+            rup_moment[:, rows] = np.einsum(
+                'pgn,pgni->pni', weight, cond_var + cond_mean ** 2)
+
+    # Mixtures over the GSIMs of each rupture, and over all ruptures
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total = rup_weights.sum(axis=1)
+        mean = rup_mean.sum(axis=1) / total[:, None]
+        var = rup_moment.sum(axis=1) / total[:, None] - mean ** 2
+
+        rup_mean /= rup_weights[..., None]
+        rup_var = rup_moment / rup_weights[..., None] - rup_mean ** 2
+        rup_weights /= total[:, None]
+
+    return {
+        'imts': list(imts),
+        'imls': np.exp(log_imls),
+        'mean': mean,
+        'std': np.sqrt(np.maximum(var, 0.)),
+        'rupture-weights': rup_weights,
+        'rupture-mean': rup_mean,
+        'rupture-std': np.sqrt(np.maximum(rup_var, 0.)),
+    }
+
+
+def get_rupture_poes(
+    ruptures: np.recarray,
+    cmaker,
+    im_ref: str,
+    imls: np.ndarray
+) -> np.ndarray:
+    """Conditional probabilities of exceeding the IMLs for each GSIM and
+    rupture, from the truncated normal distribution of the GSIMs
+
+    Parameters
+    ----------
+    ruptures : np.recarray
+        Rupture contexts with the parameters required by the GSIMs
+    cmaker : openquake.hazardlib.contexts.ContextMaker
+        Context maker of the group of the ruptures
+    im_ref : str
+        IMT, the djura names (e.g. `Sa_avg`) are supported
+    imls : np.ndarray
+        Intensity measure levels
+
+    Returns
+    -------
+    np.ndarray
+        Probabilities of exceedance with shape (GSIMs, ruptures, IMLs)
+    """
+    mean, sig = _get_mean_stds(ruptures, cmaker, [im_ref])
+    mean, sig = mean[:, 0], sig[:, 0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eps = (np.log(imls) - mean[..., None]) / sig[..., None]
+
+    phi_b = cmaker.phi_b
+    return np.clip((phi_b - ndtr(eps)) / (2 * phi_b - 1), 0., 1.)
+
+
+def _get_mean_stds(ruptures: np.recarray, cmaker, imts: List[str]) -> tuple:
+    """Means and total standard deviations of the logarithm of the IMTs,
+    with shape (GSIMs, IMTs, ruptures)
+    """
+    # Each IMT is evaluated once, the levels are not used by the GSIMs
+    unique = list(dict.fromkeys(imts))
+    cmaker = cmaker.copy(imtls=DictArray(
+        {_to_oq_imt(imt): [0.] for imt in unique}))
+
+    # The GSIMs are evaluated by magnitude, in ascending order
+    order = np.argsort(ruptures.mag, kind='stable')
+    mean_stds = np.empty((4, len(cmaker.gsims), len(unique), len(ruptures)))
+    mean_stds[..., order] = cmaker.get_mean_stds([ruptures[order]])
+
+    idx = [unique.index(imt) for imt in imts]
+    return mean_stds[0][:, idx], mean_stds[1][:, idx]
+
+
+def _get_rupture_pnes(ruptures: np.recarray, poes: np.ndarray) -> np.ndarray:
+    """Probabilities of no exceedance in the investigation time given the
+    conditional probabilities of exceedance `poes` (GSIMs, ruptures, IMLs)
+    """
+    probs = np.asarray(ruptures.probs, dtype=float)
+
+    # Poissonian, exp(-rate * time * poe) with probs = 1 - exp(-rate * time)
+    pnes = np.exp(np.log1p(-probs)[:, None] * poes)
+
+    if 'probs_occur' not in ruptures.dtype.names:
+        return pnes
+
+    nonparametric, matrix = _get_probs_occur_matrix(ruptures.probs_occur)
+    if nonparametric.any():
+        # sum of p(k occurrences) * (1 - poe) ** k
+        not_exc = 1 - poes[:, nonparametric]
+        pnes[:, nonparametric] = sum(
+            matrix[:, k, None] * not_exc ** k for k in range(matrix.shape[1]))
+        pnes = pnes.clip(0., 1.)
+
+    return pnes
+
+
+def _iter_pnes(ctx: dict, ruptures: np.recarray, im_ref: str,
+               imls: np.ndarray, chunk_size: int):
+    """Yields the group, rows in the rupture table, context maker and
+    probabilities of no exceedance (GSIMs, ruptures, IMLs) of each chunk of
+    ruptures
+    """
+    for grp_id, start, stop in zip(ctx['grp-ids'], ctx['grp-offsets'][:-1],
+                                   ctx['grp-offsets'][1:]):
+        cmaker = ctx['cmakers'][grp_id]
+        for chunk_start, chunk_stop, pnes in _iter_group_pnes(
+                ruptures[start:stop], cmaker, im_ref, imls, chunk_size):
+            yield (grp_id, start + chunk_start, start + chunk_stop, cmaker,
+                   pnes)
+
+
+def _iter_group_pnes(ruptures: np.recarray, cmaker, im_ref: str,
+                     imls: np.ndarray, chunk_size: int):
+    """Yields the rows and probabilities of no exceedance (GSIMs, ruptures,
+    IMLs) of each chunk of ruptures of a group
+    """
+    for start in range(0, len(ruptures), chunk_size):
+        stop = min(start + chunk_size, len(ruptures))
+        chunk = ruptures[start:stop]
+        poes = get_rupture_poes(chunk, cmaker, im_ref, imls)
+        yield start, stop, _get_rupture_pnes(chunk, poes)
+
+
+def _get_group_log_pnes(im_ref: str, imls: np.ndarray, chunk_size: int,
+                        item: tuple) -> np.ndarray:
+    """Summed log probabilities of no exceedance (GSIMs, IMLs) of the
+    ruptures of a group, given the ruptures and context maker in `item`
+    """
+    ruptures, cmaker = item
+    log_pnes = np.zeros((len(cmaker.gsims), len(imls)))
+    for _, _, pnes in _iter_group_pnes(
+            ruptures, cmaker, im_ref, imls, chunk_size):
+        log_pnes += np.log(pnes).sum(axis=1)
+    return log_pnes
+
+
+def _get_gsim_weights(cmaker, weights: np.ndarray) -> np.ndarray:
+    """Weight of each GSIM of a group, sum of the weights of the logic tree
+    realizations using it
+    """
+    return np.array([weights[rlzs].sum() for rlzs in cmaker.gsims.values()])
+
+
+def _get_mean_poes(ctx: dict, log_pnes: dict, weights: np.ndarray,
+                   n_imls: int) -> np.ndarray:
+    """Mean probabilities of exceedance over the logic tree realizations,
+    given the summed log probabilities of no exceedance (GSIMs, IMLs) of
+    each group
+    """
+    log_pne_rlzs = np.zeros((len(weights), n_imls))
+    for grp_id, log_pne in log_pnes.items():
+        for g, rlzs in enumerate(ctx['cmakers'][grp_id].gsims.values()):
+            log_pne_rlzs[rlzs] += log_pne[g]
+    return weights @ (1 - np.exp(log_pne_rlzs))
+
+
+def _normalise(gamma: np.ndarray) -> np.ndarray:
+    """Contributions normalised along the last axis, NaN without any"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return gamma / gamma.sum(axis=-1, keepdims=True)
+
+
+def _to_oq_imt(imt: str) -> str:
+    """OpenQuake name of an IMT, reverting the djura names of `AvgSA` and
+    `RSD` (e.g., `Sa_avg2` is an OpenQuake IMT)
+    """
+    imt = re.sub(r'^Sa_avg\(', 'AvgSA(', imt)
+    return re.sub(r'^Ds', 'RSD', imt)
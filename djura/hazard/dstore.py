@@ -1,15 +1,37 @@
 from pathlib import Path
-from typing import Union
+from typing import List, Union
+from functools import partial
+import hashlib
+import inspect
+import json
+import h5py
+import pickle
+import tempfile
 import numpy as np
+from scipy.spatial import cKDTree
 from openquake.commonlib.datastore import DataStore
-from openquake.hazardlib.contexts import read_cmakers, read_ctx_by_grp
+from openquake.hazardlib.contexts import read_cmakers
+from openquake.hazardlib.site import SiteCollection
 from openquake.baselib.python3compat import decode
 from openquake.hazardlib import valid
-import numpy.lib.recfunctions as rfn
+
+from djura.utilities import create_path, map_jobs, remove_path
+from djura.hazard.psha import (
+    _proc_hazard_curve_blocks, _proc_hazard_curve_sites, _reduce_disagg,
+    _add_occurrence_disagg, _sparsify_disagg, _save_output
+)
+
+# Layout of the cached contexts, to be increased whenever it changes so that
+# caches written by other versions are not loaded
+_CACHE_VERSION = 2
 
 
 def get_context_from_dstore(dstore_path: Union[str, Path], im_ref: str = None,
-                            n_rups: int = None, site_id: int = 0):
+                            n_rups: int = None,
+                            site_id: Union[int, List[int],
+                                           SiteCollection] = 0,
+                            cache_dir: Union[str, Path] = None,
+                            fields: List[str] = None, n_jobs: int = None):
     """
     Extracts rupture context and hazard information from an OpenQuake
     datastore.
@@ -30,10 +52,32 @@ def get_context_from_dstore(dstore_path: Union[str, Path], im_ref: str = None,
         in the datastore. Used for validation.
     n_rups : int, optional
         Number of ruptures with the highest occurrence probability to consider
-        (e.g., for record selection). If None, no filtering is applied.
-    site_id : int, optional
-        Index of the site for which the context is extracted.
+        (e.g., for record selection). The top `n_rups` ruptures of each site
+        are selected across all groups, and the other ruptures are dropped
+        from `ctx_by_grp`. If None, no filtering is applied.
+    site_id : int, List[int] or SiteCollection, optional
+        Index of the site for which the context is extracted, a list of site
+        indices (duplicates are ignored), a `SiteCollection` for its sites,
+        or None for all sites of the datastore.
         Default is 0 (first site in the datastore).
+    cache_dir : str or Path, optional
+        Directory where the extracted contexts are cached. The cache entry is
+        keyed on the datastore path, size and modification time, `site_id`,
+        `im_ref`, `n_rups` and `fields`, and it is loaded instead of
+        processing the datastore on repeated calls. With a cache, the rupture
+        tables are `LazyContext` objects over the memory mapped columns of
+        the cache, on the first call as on later ones. If None, no caching
+        is done.
+    fields : List[str], optional
+        Rupture and site parameters of the contexts to keep, e.g.
+        ``['mag', 'rjb', 'vs30']``. If provided, the contexts are
+        `LazyContext` objects reading only these columns from the datastore
+        when first accessed, in addition to `sids` and `probs`. If None, all
+        parameters are read into record arrays.
+    n_jobs : int, optional
+        Number of worker processes reading and processing the groups (source
+        models) of the datastore. If None or 1, the groups are processed
+        serially.
 
     Returns
     -------
@@ -41,12 +85,21 @@ def get_context_from_dstore(dstore_path: Union[str, Path], im_ref: str = None,
         A tuple containing:
         - result : dict
             A dictionary with the following keys:
-                - 'ctx_by_grp': Contexts grouped by source model.
+                - 'site-id': Index of the site.
+                - 'ctx_by_grp': Contexts grouped by source model, as views
+                of 'ruptures'.
+                - 'ruptures': Rupture table of all contexts, ordered by
+                source model, with a `grp_id` column.
+                - 'grp-ids': Source models of the rupture table.
+                - 'grp-offsets': Offsets of the source models in the
+                rupture table, with the number of ruptures last.
                 - 'hazard-curves': Hazard curves (mean or realization).
                 - 'lt-weights': Logic tree branch weights.
                 - 'gsims': GSIMs and their configuration from the datastore.
                 - 'gsim-weights': Weights associated with each GSIM.
                 - 'data': Detailed GSIM type and initialization parameters.
+                - 'cmakers': Context makers of the groups (source models),
+                used to evaluate the GSIMs.
                 - 'im_ref': Reference IMT used.
                 - 'imt': Dictionary of available IMTs in the hazard model.
                 - 'invtime': Investigation time used in the analysis.
@@ -61,18 +114,24 @@ def get_context_from_dstore(dstore_path: Union[str, Path], im_ref: str = None,
         - oq : openquake.commonlib.oqvalidation.OqParam
             The parsed OpenQuake input parameter object.
 
+        If `site_id` is a list, a `SiteCollection` or None, `result` is a
+        dictionary of such results by site index instead. Each group of the
+        datastore is read and processed only once for all sites.
+
     Raises
     ------
     ValueError
         If `im_ref` is provided but not found among available IMTs in the
-        datastore.
+        datastore, if `fields` includes unknown parameters, or if `n_rups`
+        is negative.
 
     Notes
     -----
     - The function currently supports a single logic tree branching level.
     - All IMTs are converted from `AvgSA` to `Sa_avg` to maintain consistency.
-    - Only the specified `site_id` is used. Support for multiple sites via
-      OpenQuake's `SiteCollection` may be added in the future.
+    - Sources groups without ruptures affecting a site are not included in
+      its `ctx_by_grp`.
+    - The ruptures of each group are in the order of the datastore.
 
     Example
     -------
@@ -80,79 +139,25 @@ def get_context_from_dstore(dstore_path: Union[str, Path], im_ref: str = None,
     >>> ctx_data["hazard-curves"].shape
     (1, 1, 20)  # (IMT, site, number of poes)
     """
+    if n_rups is not None and n_rups < 0:
+        raise ValueError(f"Number of ruptures must not be negative, got "
+                         f"{n_rups}!")
 
-    # n_rups = number of ruptures with highest weight to consider
-    # will be used and processed during record selection
-
-    def _get_gsim_parameters(dstore_gsims):
-        all_gsims = []
-        for item in dstore_gsims:
-            decoded = item.decode('utf-8')
-            if '[' in decoded and ']' in decoded:
-                key = decoded[decoded.find('[') + 1:decoded.find(']')]
-                content = decoded[decoded.find(']') + 1:].strip()
-
-                # Parse the content into dictionary
-                values = {}
-                for line in content.split('\n'):
-                    if '=' in line:
-                        k, v = line.split('=', 1)
-                        k = k.strip()
-                        v = v.strip().strip('"')
-                        # Convert numbers to float if possible
-                        try:
-                            v = float(v)
-                        except ValueError:
-                            pass
-                        values[k] = v
-
-                all_gsims.append({key: values})
-
-        return all_gsims
-
-    def _get_gsim_init_parameters(instance):
-        import inspect
-
-        init_method = instance.__init__
-
-        # Get the signature of the __init__ method
-        init_signature = inspect.signature(init_method)
-
-        # Get the parameter names of __init__ (excluding 'self')
-        init_params = [
-            param for param in init_signature.parameters if param != "self"]
-
-        # Extract variables and their values from the instance's __dict__
-        variables_dict = {
-            # Use getattr to safely fetch the attribute
-            param: getattr(instance, param, None)
-            for param in init_params
-            if hasattr(instance, param)  # Ensure the attribute exists
-        }
+    if isinstance(site_id, SiteCollection):
+        site_id = site_id.sids.tolist()
 
-        return variables_dict
+    # Lazy and cached contexts keep the path, which must not depend on the
+    # working directory
+    dstore_path = Path(dstore_path).resolve()
 
-    def _convert_avgsa_to_sa_avg(s: str):
-        if s is None:
-            return s
-        return s.replace('AvgSA', 'Sa_avg')
+    if cache_dir is not None:
+        cache_path = Path(cache_dir) / _get_cache_key(
+            dstore_path, im_ref, n_rups, site_id, fields)
+        if (cache_path / "meta.pickle").exists():
+            return _load_cached_context(cache_path)
 
-    def _convert_rsds_to_ds(s: str):
-        if s is None:
-            return s
-        return s.replace('RSD', 'Ds')
+    dstore = DataStore(str(dstore_path), mode='r')
 
-    def _replace_dict_keys(data, old='AvgSA', new='Sa_avg'):
-        new_dict = {}
-        for key, value in data.items():
-            new_key = key.replace(old, new)
-            new_dict[new_key] = value
-        return new_dict
-
-    dstore = DataStore(str(dstore_path))
-
-    # Context by each group (source model)
-    ctx_by_grp = read_ctx_by_grp(dstore)
     oq = dstore["oqparam"]
     imtls = dict(oq.imtls)
     cmakers = read_cmakers(dstore)
@@ -185,75 +190,1090 @@ def get_context_from_dstore(dstore_path: Union[str, Path], im_ref: str = None,
 
     all_gsims = _get_gsim_parameters(dstore['gsims'][:])
 
-    add_data = {}
-    for grp_id, ctxt in ctx_by_grp.items():
-        # Site IDs, only one site allowed
-        # TODO, add possibility to use SiteCollection of OQ
-        ctx = ctxt[ctxt.sids == site_id]
-
-        tom = valid.occurrence_model(toms[grp_id])
-        cmaker = cmakers[grp_id]
-        # poes = cmaker.poes
-        phi_b = cmaker.phi_b
-        invtime = cmaker.investigation_time
-        gsims = cmaker.gsims
-
-        gsims_type_converted = []
-        gsim_parameters = []
-        for key in gsims:
-            gmm_name = key.__class__.__name__
-            _gsim = {
-                gmm_name: gsims[key]
-            }
-
-            gsim_parameter = _get_gsim_init_parameters(key)
-
-            if list(_gsim.keys())[0] == "GmpeIndirectAvgSA":
-                gsim_parameter = gsim_parameter['kwargs']
-                _gsim = _replace_dict_keys(
-                    _gsim, 'GmpeIndirectAvgSA',
-                    gsim_parameter['gmpe_name']
-                )
-
-            gsims_type_converted.append(_gsim)
-            gsim_parameters.append(gsim_parameter)
-
-        add_data[grp_id] = {
-            'gsims': gsims_type_converted,
-            'parameters': gsim_parameters,
-        }
+    multi_site = site_id is None or not np.isscalar(site_id)
+    site_ids = _get_site_ids(dstore, site_id)
 
-        if len(ctx.probs_occur[0]):
-            probs = np.array([np.sum(p[1:]) for p in ctx.probs_occur])
-        else:
-            probs = tom.get_probability_one_or_more_occurrences(
-                ctx.occurrence_rate)
+    names = _get_context_fields(dstore, fields)
+
+    # Rows of the requested sites in each group (source model), sorted by
+    # site, only the group and site indices of the ruptures are read here
+    rup_grp_ids = dstore['rup/grp_id'][:]
+    rup_sids = dstore['rup/sids'][:]
+    all_rows = np.flatnonzero(np.isin(rup_sids, site_ids))
+    items = []
+    for grp_id in np.unique(rup_grp_ids).tolist():
+        rows = all_rows[rup_grp_ids[all_rows] == grp_id]
+        rows = rows[np.argsort(rup_sids[rows], kind='stable')]
+        items.append((grp_id, rows, rup_sids[rows], toms[grp_id],
+                      cmakers[grp_id]))
+    del rup_grp_ids, rup_sids, all_rows
 
-        ctx = rfn.append_fields(ctx, "probs", probs,
-                                usemask=False).view(np.recarray)
+    # Each group is read and processed independently, the workers open the
+    # datastore read-only
+    processed = map_jobs(
+        partial(_process_group, str(dstore_path), names, fields is None),
+        items, n_jobs)
 
-        ctx_by_grp[grp_id] = ctx
+    # Rupture table of each site, ordered by group, with the offsets of
+    # the groups
+    add_data = {}
+    pieces = {sid: [] for sid in site_ids}
+    for (grp_id, *_), (gsim_data, ctx) in zip(items, processed):
+        add_data[grp_id] = gsim_data
+        sids, starts = np.unique(ctx['sids'], return_index=True)
+        stops = np.r_[starts[1:], len(ctx)]
+        for sid, start, stop in zip(sids.tolist(), starts, stops):
+            pieces[sid].append((grp_id, ctx[start:stop]))
+    del processed
 
     # Same GSIMs (i.e., required parameters) for all source models
+    cmaker = cmakers[0]
+    phi_b = cmaker.phi_b
+    invtime = cmaker.investigation_time
     req_pars = cmaker.REQUIRES_DISTANCES | cmaker.REQUIRES_RUPTURE_PARAMETERS
 
+    ruptures = {}
+    grp_ids = {}
+    offsets = {}
+    for sid in site_ids:
+        grp_ids[sid] = np.array([grp_id for grp_id, _ in pieces[sid]],
+                                dtype=int)
+        offsets[sid] = np.cumsum([0, *(len(ctx) for _, ctx in pieces[sid])])
+        contexts = [ctx for _, ctx in pieces.pop(sid)]
+        if fields is not None:
+            ruptures[sid] = _concatenate_lazy(contexts, str(dstore_path),
+                                              names)
+        elif contexts:
+            ruptures[sid] = np.concatenate(contexts).view(np.recarray)
+        else:
+            # No ruptures affect the site, empty table with all parameters
+            ruptures[sid] = _read_contexts(
+                str(dstore_path), names, True, 0, np.empty(0, dtype=int),
+                np.empty(0, dtype=dstore['rup/sids'].dtype),
+                valid.occurrence_model(toms[0]))
+
     # Logic tree branch weights
     weights = dstore['weights'][:]
 
+    results = {}
+    for sid in site_ids:
+        if n_rups is not None:
+            ruptures[sid], grp_ids[sid], offsets[sid] = _select_top_ruptures(
+                ruptures[sid], grp_ids[sid], offsets[sid], n_rups)
+
+        results[sid] = {
+            'site-id': sid,
+            'ctx_by_grp': _split_by_grp(
+                ruptures[sid], grp_ids[sid], offsets[sid]),
+            'ruptures': ruptures[sid],
+            'grp-ids': grp_ids[sid],
+            'grp-offsets': offsets[sid],
+            'hazard-curves': curves,
+            'lt-weights': weights,
+            'gsims': all_gsims,
+            'gsim-weights': dstore['gweights'][:],
+            'data': add_data,
+            'cmakers': cmakers,
+            'im_ref': im_ref,
+            'imt': imtls,
+            'invtime': invtime,
+            'oq-poes': oq.poes,
+            'phi_b': phi_b,
+            'totrups': len(dstore['rup/mag']),
+            'site-parameters': oq.req_site_params,
+            'required-parameters': req_pars,
+            'n_rups': n_rups,
+        }
+
+    dstore.close()
+
+    if not multi_site:
+        results = results[site_ids[0]]
+
+    if cache_dir is not None:
+        _save_cached_context(cache_path, results, oq, multi_site,
+                             dstore_path)
+        # Same memory mapped tables as on later calls
+        return _load_cached_context(cache_path)
+
+    return results, oq
+
+
+def iter_contexts_from_dstore(dstore_path: Union[str, Path],
+                              site_id: Union[int, List[int],
+                                             SiteCollection] = 0,
+                              fields: List[str] = None,
+                              chunk_size: int = 100_000):
+    """
+    Iterates over the rupture contexts of an OpenQuake datastore in chunks
+    of bounded size.
+
+    This is the streaming counterpart of `get_context_from_dstore` for
+    datastores whose contexts do not fit in memory. The ruptures of the
+    datastore are scanned in blocks of `chunk_size` rows, and the contexts
+    of each block are yielded by group (source model) and site, together
+    with their occurrence probabilities. Only one block is held in memory
+    at a time.
+
+    Parameters
+    ----------
+    dstore_path : str or Path
+        Path to the OpenQuake datastore (`.hdf5`) file.
+    site_id : int, List[int] or SiteCollection, optional
+        Index of the site for which the contexts are read, a list of site
+        indices, a `SiteCollection` for its sites, or None for all sites of
+        the datastore.
+        Default is 0 (first site in the datastore).
+    fields : List[str], optional
+        Rupture and site parameters of the contexts to read, e.g.
+        ``['mag', 'rjb', 'vs30']``, in addition to `sids`, `grp_id` and
+        `probs`. If None, all parameters are read.
+    chunk_size : int, optional
+        Number of ruptures of the datastore scanned at once, and maximum
+        number of ruptures of a chunk. Default is 100000.
+
+    Yields
+    ------
+    tuple
+        Site index, group index, and record array of the contexts with the
+        occurrence probabilities `probs`, in the order of the datastore.
+
+    Raises
+    ------
+    ValueError
+        If `fields` includes unknown parameters.
+
+    Example
+    -------
+    >>> probs = [ctx.probs for _, _, ctx in
+    ...          iter_contexts_from_dstore("calc_1234.hdf5", fields=['mag'])]
+    """
+    dstore_path = Path(dstore_path).resolve()
+    dstore = DataStore(str(dstore_path), mode='r')
+    try:
+        toms = [valid.occurrence_model(tom)
+                for tom in decode(dstore['toms'][:])]
+        names = _get_context_fields(dstore, fields)
+        site_ids = _get_site_ids(dstore, site_id)
+
+        n_total = len(dstore['rup/grp_id'])
+        for block in range(0, n_total, chunk_size):
+            block = slice(block, min(block + chunk_size, n_total))
+            grp_ids = dstore['rup/grp_id'][block]
+            sids = dstore['rup/sids'][block]
+
+            # Rows of the requested sites, sorted by group and site
+            rows = np.flatnonzero(np.isin(sids, site_ids))
+            rows = rows[np.lexsort((sids[rows], grp_ids[rows]))]
+            if not len(rows):
+                continue
+
+            # Each group of the block is read at once, then split by site
+            _, starts = np.unique(grp_ids[rows], return_index=True)
+            stops = np.r_[starts[1:], len(rows)]
+            for start, stop in zip(starts, stops):
+                grp_id = int(grp_ids[rows[start]])
+                chunk = rows[start:stop]
+                ctx = _read_contexts(
+                    str(dstore_path), names, True, grp_id,
+                    block.start + chunk, sids[chunk], toms[grp_id])
+
+                ctx_sids, ctx_starts = np.unique(ctx.sids, return_index=True)
+                ctx_stops = np.r_[ctx_starts[1:], len(ctx)]
+                for sid, ctx_start, ctx_stop in zip(
+                        ctx_sids.tolist(), ctx_starts, ctx_stops):
+                    yield sid, grp_id, ctx[ctx_start:ctx_stop]
+    finally:
+        dstore.close()
+
+
+def _get_site_ids(dstore: DataStore,
+                  site_id: Union[int, List[int], SiteCollection] = None
+                  ) -> List[int]:
+    """Indices of the requested sites, without duplicates, all sites of the
+    datastore if `site_id` is None
+    """
+    if site_id is None:
+        return dstore['sitecol'].sids.tolist()
+    if isinstance(site_id, SiteCollection):
+        site_id = site_id.sids
+    return list(dict.fromkeys(np.atleast_1d(site_id).tolist()))
+
+
+def _get_gsim_parameters(dstore_gsims):
+    all_gsims = []
+    for item in dstore_gsims:
+        decoded = item.decode('utf-8')
+        if '[' in decoded and ']' in decoded:
+            key = decoded[decoded.find('[') + 1:decoded.find(']')]
+            content = decoded[decoded.find(']') + 1:].strip()
+
+            # Parse the content into dictionary
+            values = {}
+            for line in content.split('\n'):
+                if '=' in line:
+                    k, v = line.split('=', 1)
+                    k = k.strip()
+                    v = v.strip().strip('"')
+                    # Convert numbers to float if possible
+                    try:
+                        v = float(v)
+                    except ValueError:
+                        pass
+                    values[k] = v
+
+            all_gsims.append({key: values})
+
+    return all_gsims
+
+
+def _get_gsim_init_parameters(instance):
+    init_method = instance.__init__
+
+    # Get the signature of the __init__ method
+    init_signature = inspect.signature(init_method)
+
+    # Get the parameter names of __init__ (excluding 'self')
+    init_params = [
+        param for param in init_signature.parameters if param != "self"]
+
+    # Extract variables and their values from the instance's __dict__
+    variables_dict = {
+        # Use getattr to safely fetch the attribute
+        param: getattr(instance, param, None)
+        for param in init_params
+        if hasattr(instance, param)  # Ensure the attribute exists
+    }
+
+    return variables_dict
+
+
+def _convert_avgsa_to_sa_avg(s: str):
+    if s is None:
+        return s
+    return s.replace('AvgSA', 'Sa_avg')
+
+
+def _convert_rsds_to_ds(s: str):
+    if s is None:
+        return s
+    return s.replace('RSD', 'Ds')
+
+
+def _replace_dict_keys(data, old='AvgSA', new='Sa_avg'):
+    new_dict = {}
+    for key, value in data.items():
+        new_key = key.replace(old, new)
+        new_dict[new_key] = value
+    return new_dict
+
+
+def _get_gsim_data(cmaker) -> dict:
+    """GSIMs of a group, with their initialization parameters"""
+    gsims = cmaker.gsims
+
+    gsims_type_converted = []
+    gsim_parameters = []
+    for key in gsims:
+        gmm_name = key.__class__.__name__
+        _gsim = {
+            gmm_name: gsims[key]
+        }
+
+        gsim_parameter = _get_gsim_init_parameters(key)
+
+        if list(_gsim.keys())[0] == "GmpeIndirectAvgSA":
+            gsim_parameter = gsim_parameter['kwargs']
+            _gsim = _replace_dict_keys(
+                _gsim, 'GmpeIndirectAvgSA',
+                gsim_parameter['gmpe_name']
+            )
+
+        gsims_type_converted.append(_gsim)
+        gsim_parameters.append(gsim_parameter)
+
     return {
-        'ctx_by_grp': ctx_by_grp,
-        'hazard-curves': curves,
-        'lt-weights': weights,
-        'gsims': all_gsims,
-        'gsim-weights': dstore['gweights'][:],
-        'data': add_data,
-        'im_ref': im_ref,
-        'imt': imtls,
-        'invtime': invtime,
-        'oq-poes': oq.poes,
-        'phi_b': phi_b,
-        'totrups': len(dstore['rup/mag']),
-        'site-parameters': oq.req_site_params,
-        'required-parameters': req_pars,
-        'n_rups': n_rups,
-    }, oq
+        'gsims': gsims_type_converted,
+        'parameters': gsim_parameters,
+    }
+
+
+def _get_cache_key(dstore_path: Union[str, Path], *args) -> str:
+    """Key of the cached contexts of a datastore, changes with the layout of
+    the cache, the size and modification time of the datastore and with the
+    extraction arguments
+    """
+    dstore_path = Path(dstore_path).resolve()
+    stat = dstore_path.stat()
+    key = repr((_CACHE_VERSION, str(dstore_path), stat.st_size,
+                stat.st_mtime_ns, *args))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _save_cached_context(cache_path: Path, results: dict, oq,
+                         multi_site: bool, dstore_path: Union[str, Path]):
+    """Stores the rupture tables as NPY columns, one folder per site, and
+    the remaining results in a small metadata pickle
+
+    Only the columns already read are stored, the other fields of lazy
+    contexts are still read from the datastore when accessed. Variable
+    length columns, i.e. `probs_occur`, are stored flattened with their
+    offsets.
+    """
+    by_site = results if multi_site else {None: results}
+
+    create_path(cache_path.parent)
+    tmp_path = Path(tempfile.mkdtemp(dir=cache_path.parent))
+
+    meta = {}
+    for sid, result in by_site.items():
+        ruptures = result['ruptures']
+        if isinstance(ruptures, LazyContext):
+            columns = ruptures.columns
+            table = {'fields': ruptures.fields, 'rows': ruptures.rows}
+        else:
+            columns = {name: ruptures[name] for name in ruptures.dtype.names}
+            table = {'fields': [], 'rows': None}
+
+        folder = tmp_path / f"{sid}"
+        create_path(folder)
+        if table['rows'] is not None:
+            np.save(folder / "_rows.npy", table['rows'])
+
+        table['rows'] = table['rows'] is not None
+        table['columns'] = list(columns)
+        table['ragged'] = []
+        for name, values in columns.items():
+            if isinstance(values, _RaggedColumn):
+                values = values.to_object()
+            if values.dtype == object:
+                # Variable length, stored flattened with the offsets
+                lengths = np.frompyfunc(len, 1, 1)(values).astype(int)
+                np.save(folder / f"{name}_offsets.npy",
+                        np.cumsum([0, *lengths]))
+                np.save(folder / f"{name}.npy",
+                        np.concatenate([np.empty(0), *values]))
+                table['ragged'].append(name)
+            else:
+                np.save(folder / f"{name}.npy", values)
+
+        meta[sid] = {k: v for k, v in result.items()
+                     if k not in ('ctx_by_grp', 'ruptures')}
+        meta[sid]['ruptures'] = table
+
+    with open(tmp_path / "meta.pickle", "wb") as f:
+        pickle.dump({'results': meta, 'oq': oq, 'multi_site': multi_site,
+                     'dstore_path': str(dstore_path)}, f)
+
+    try:
+        tmp_path.rename(cache_path)
+    except OSError:
+        # Already cached by a concurrent call
+        remove_path(tmp_path)
+
+
+def _load_cached_context(cache_path: Path):
+    """Loads the rupture tables stored by `_save_cached_context` as
+    `LazyContext` over the memory mapped columns, without reading them
+    """
+    with open(cache_path / "meta.pickle", "rb") as f:
+        meta = pickle.load(f)
+
+    results = {}
+    for sid, result in meta['results'].items():
+        folder = cache_path / f"{sid}"
+        table = result['ruptures']
+        columns = {}
+        for name in table['columns']:
+            values = np.load(folder / f"{name}.npy", mmap_mode='r')
+            if name in table['ragged']:
+                offsets = np.load(folder / f"{name}_offsets.npy",
+                                  mmap_mode='r')
+                values = _RaggedColumn(values, offsets[:-1], offsets[1:])
+            columns[name] = values
+
+        rows = None
+        if table['rows']:
+            rows = np.load(folder / "_rows.npy", mmap_mode='r')
+        ruptures = LazyContext(meta['dstore_path'], rows, table['fields'],
+                               columns)
+
+        results[sid] = {
+            **result,
+            'ctx_by_grp': _split_by_grp(
+                ruptures, result['grp-ids'], result['grp-offsets']),
+            'ruptures': ruptures,
+        }
+
+    if not meta['multi_site']:
+        results = results[None]
+
+    return results, meta['oq']
+
+
+class _RaggedColumn:
+    """Variable length column, e.g. `probs_occur`, as flat values and the
+    bounds of each row in them. Selecting rows does not copy the values,
+    which are only split into arrays by `to_object`.
+    """
+
+    def __init__(self, values: np.ndarray, starts: np.ndarray,
+                 stops: np.ndarray):
+        self.values = values
+        self.starts = starts
+        self.stops = stops
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, key):
+        if np.isscalar(key):
+            return self.values[self.starts[key]:self.stops[key]]
+        return _RaggedColumn(self.values, self.starts[key], self.stops[key])
+
+    def to_object(self) -> np.ndarray:
+        """Values of each row, as an object array"""
+        column = np.empty(len(self), dtype=object)
+        for i, (start, stop) in enumerate(
+                zip(self.starts.tolist(), self.stops.tolist())):
+            column[i] = self.values[start:stop]
+        return column
+
+
+class LazyContext:
+    """Rupture contexts of a source group whose columns are read from the
+    datastore when first accessed
+
+    Columns are accessed as in `np.recarray`, ``ctx['mag']`` or
+    ``ctx.mag``, and are kept once read. Selecting rows with a slice, a
+    boolean mask or indices returns a new `LazyContext` of these ruptures,
+    with the columns read so far.
+
+    Parameters
+    ----------
+    dstore_path : str or Path
+        Path to the OpenQuake datastore (`.hdf5`) file.
+    rows : np.ndarray
+        Indices of the ruptures in the `rup` datasets of the datastore, or
+        None if all columns are available, e.g. loaded from a cache.
+    fields : List[str]
+        Rupture parameters (`rup` datasets) or site parameters (`sitecol`
+        datasets) that can be read.
+    columns : dict, optional
+        Columns already available, by name, e.g. `sids` and `probs`.
+    """
+
+    def __init__(self, dstore_path: Union[str, Path], rows: np.ndarray,
+                 fields: List[str], columns: dict = None):
+        self.dstore_path = str(dstore_path)
+        self.rows = rows
+        self.fields = list(fields)
+        self.columns = {} if columns is None else columns
+
+    @property
+    def names(self) -> List[str]:
+        """Names of all columns, loaded or not"""
+        return list(dict.fromkeys([*self.columns, *self.fields]))
+
+    def __len__(self):
+        if self.rows is None:
+            return len(next(iter(self.columns.values())))
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self.columns:
+                self.load([key])
+            if isinstance(self.columns[key], _RaggedColumn):
+                self.columns[key] = self.columns[key].to_object()
+            return self.columns[key]
+
+        rows = None if self.rows is None else self.rows[key]
+        return LazyContext(
+            self.dstore_path, rows, self.fields,
+            {name: values[key] for name, values in self.columns.items()})
+
+    def __getattr__(self, name):
+        # Only reached for missing attributes, guards against recursion
+        # before __init__, e.g. when unpickling
+        if name.startswith('_') or name in (
+                'dstore_path', 'rows', 'fields', 'columns'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __repr__(self):
+        return (f"<LazyContext {len(self)} ruptures, "
+                f"loaded {list(self.columns)} of {self.names}>")
+
+    def load(self, names: List[str] = None) -> 'LazyContext':
+        """Reads the given columns, or all of them, opening the datastore
+        only once
+        """
+        names = self.fields if names is None else names
+        names = [name for name in names if name not in self.columns]
+        unknown = set(names) - set(self.fields)
+        if unknown:
+            raise KeyError(", ".join(sorted(unknown)))
+        if not names:
+            return self
+
+        # Same flags as the read-only datastore, which may be open
+        with h5py.File(self.dstore_path, 'r', swmr=True) as f:
+            site_idx = None
+            for name in names:
+                if name in f['rup']:
+                    self.columns[name] = self._read_column(f, name)
+                    continue
+                if site_idx is None:
+                    # Rows of the sites in the site collection, shared by
+                    # all site parameters
+                    site_idx = self._get_site_index(f)
+                self.columns[name] = _read_rows(f['sitecol/' + name],
+                                                site_idx)
+        return self
+
+    def _read_column(self, f: h5py.File, name: str) -> np.ndarray:
+        if name == 'occurrence_rate':
+            # Cast as in OpenQuake, float32 rates lose precision in
+            # the occurrence probabilities
+            return _read_rows(f['rup/' + name], self.rows).astype(float)
+        return _read_rows(f['rup/' + name], self.rows)
+
+    def _get_site_index(self, f: h5py.File) -> np.ndarray:
+        if 'sids' in self.columns:
+            sids = self.columns['sids']
+        else:
+            sids = _read_rows(f['rup/sids'], self.rows)
+        # The site collection is sorted by site index
+        return np.searchsorted(f['sitecol/sids'][:], sids)
+
+    def to_recarray(self) -> np.recarray:
+        """Reads all columns into a record array"""
+        self.load()
+        columns = {name: self[name] for name in self.names}
+        # Without the metadata of the HDF5 variable length types
+        ctx = np.empty(len(self), dtype=[
+            (name, values.dtype.str) for name, values in columns.items()])
+        for name, values in columns.items():
+            ctx[name] = values
+        return ctx.view(np.recarray)
+
+
+def _get_context_fields(dstore: DataStore,
+                        fields: List[str] = None) -> List[str]:
+    """Rupture and site parameters of the contexts to read, all of them if
+    `fields` is None. The group and site indices and the occurrence
+    probabilities are always available and are not included.
+    """
+    rup_names = list(dstore['rup'])
+    site_names = list(dstore['sitecol'].array.dtype.names)
+    if fields is None:
+        fields = rup_names + site_names
+    else:
+        unknown = set(fields) - set(rup_names) - set(site_names) - {'probs'}
+        if unknown:
+            raise ValueError(f"Unknown context fields: {sorted(unknown)}")
+    return [name for name in dict.fromkeys(fields)
+            if name not in ('sids', 'grp_id', 'probs')]
+
+
+def _process_group(dstore_path: str, fields: List[str], load: bool,
+                   item: tuple) -> tuple:
+    """Reads the contexts of a group (source model) for the requested sites
+    and computes their occurrence probabilities
+
+    Parameters
+    ----------
+    dstore_path : str
+        Path to the OpenQuake datastore (`.hdf5`) file.
+    fields : List[str]
+        Rupture and site parameters of the contexts.
+    load : bool
+        Whether to read the parameters into a record array, otherwise they
+        are read lazily.
+    item : tuple
+        Group index, rows of the ruptures in the datastore, their site
+        indices, temporal occurrence model and context maker of the group.
+
+    Returns
+    -------
+    tuple
+        GSIMs of the group with their parameters, and the contexts with
+        the occurrence probabilities `probs`, as a record array or a
+        `LazyContext`.
+    """
+    grp_id, rows, sids, tom, cmaker = item
+    ctx = _read_contexts(dstore_path, fields, load, grp_id, rows, sids,
+                         valid.occurrence_model(tom))
+    return _get_gsim_data(cmaker), ctx
+
+
+def _read_contexts(dstore_path: str, fields: List[str], load: bool,
+                   grp_id: int, rows: np.ndarray, sids: np.ndarray,
+                   tom) -> Union[np.recarray, LazyContext]:
+    """Contexts of ruptures of a group, with their occurrence probabilities
+    `probs`, as a record array if `load`, otherwise as a `LazyContext`
+    """
+    ctx = LazyContext(dstore_path, rows, fields, {
+        'sids': sids, 'grp_id': np.full(len(rows), grp_id, dtype=np.uint16)})
+    if load:
+        ctx.load()
+
+    occ_fields = ['probs_occur', 'occurrence_rate']
+    if all(name in ctx.columns for name in occ_fields):
+        occ = ctx
+    else:
+        # The occurrence parameters are read only to compute the
+        # probabilities, and are not kept unless requested
+        occ = LazyContext(dstore_path, rows, occ_fields).load()
+    ctx.columns['probs'] = _get_occurrence_probs(
+        occ.probs_occur, occ.occurrence_rate, tom)
+
+    return ctx.to_recarray() if load else ctx
+
+
+def _concatenate_lazy(contexts: List[LazyContext],
+                      dstore_path: Union[str, Path],
+                      fields: List[str]) -> LazyContext:
+    """Concatenates lazy contexts of the same datastore, the columns
+    loaded in all of them are kept
+    """
+    names = ['sids', 'grp_id', 'probs']
+    if not contexts:
+        return LazyContext(dstore_path, np.empty(0, dtype=int), fields,
+                           {name: np.empty(0) for name in names})
+
+    names = [name for name in contexts[0].columns
+             if all(name in ctx.columns for ctx in contexts)]
+    return LazyContext(
+        dstore_path, np.concatenate([ctx.rows for ctx in contexts]), fields,
+        {name: np.concatenate([ctx.columns[name] for ctx in contexts])
+         for name in names})
+
+
+def _read_rows(dset: h5py.Dataset, rows: np.ndarray) -> np.ndarray:
+    """Reads rows of a dataset through the contiguous window between the
+    first and the last of them, which is much faster than fancy indexing
+    """
+    if not len(rows):
+        return dset[:0]
+    start, stop = rows.min(), rows.max() + 1
+    return dset[start:stop][rows - start]
+
+
+def _get_occurrence_probs(probs_occur: np.ndarray,
+                          occurrence_rate: np.ndarray, tom) -> np.ndarray:
+    """Probabilities of one or more occurrences of the ruptures
+
+    For nonparametric ruptures, the probabilities of occurrence are padded
+    with zeros into a (ruptures x occurrences) matrix, see
+    `_get_probs_occur_matrix`, whose columns beyond zero occurrences are
+    summed at once.
+
+    Parameters
+    ----------
+    probs_occur : np.ndarray
+        Probabilities of the number of occurrences of each rupture, empty
+        for parametric ruptures
+    occurrence_rate : np.ndarray
+        Occurrence rate of each rupture
+    tom : openquake.hazardlib.tom.BaseTOM
+        Temporal occurrence model of the source group
+
+    Returns
+    -------
+    np.ndarray
+        Occurrence probability of each rupture
+    """
+    nonparametric, matrix = _get_probs_occur_matrix(probs_occur)
+
+    probs = np.empty(len(probs_occur))
+    if not nonparametric.all():
+        probs[~nonparametric] = tom.get_probability_one_or_more_occurrences(
+            occurrence_rate[~nonparametric])
+
+    if nonparametric.any():
+        probs[nonparametric] = matrix[:, 1:].sum(axis=1)
+
+    return probs
+
+
+def _get_probs_occur_matrix(probs_occur: np.ndarray) -> tuple:
+    """Nonparametric ruptures, i.e. with probabilities of the number of
+    occurrences, and these probabilities padded with zeros into a
+    (nonparametric ruptures x occurrences) matrix
+
+    Parameters
+    ----------
+    probs_occur : np.ndarray
+        Probabilities of the number of occurrences of each rupture, empty
+        for parametric ruptures
+
+    Returns
+    -------
+    tuple
+        Boolean mask of the nonparametric ruptures, and the matrix of their
+        probabilities of 0, 1, ... occurrences
+    """
+    lengths = np.frompyfunc(len, 1, 1)(probs_occur).astype(int)
+    nonparametric = lengths > 0
+
+    lengths = lengths[nonparametric]
+    matrix = np.zeros((len(lengths), lengths.max(initial=0)))
+    matrix[np.arange(matrix.shape[1]) < lengths[:, None]] = \
+        np.concatenate([np.empty(0), *probs_occur[nonparametric]])
+
+    return nonparametric, matrix
+
+
+def _select_top_ruptures(ruptures: np.recarray, grp_ids: np.ndarray,
+                         offsets: np.ndarray, n_rups: int) -> tuple:
+    """Keeps the `n_rups` ruptures with the highest occurrence probability
+    across all groups, preserving their group and their order within it
+
+    Parameters
+    ----------
+    ruptures : np.recarray or LazyContext
+        Rupture table ordered by group, including the occurrence
+        probabilities `probs`
+    grp_ids : np.ndarray
+        Groups of the rupture table
+    offsets : np.ndarray
+        Offsets of the groups in the rupture table, with the total number
+        of ruptures last
+    n_rups : int
+        Number of ruptures to keep
+
+    Returns
+    -------
+    tuple
+        Trimmed rupture table, groups and offsets, groups without selected
+        ruptures are dropped
+    """
+    probs = ruptures['probs']
+    if n_rups >= len(probs):
+        return ruptures, grp_ids, offsets
+
+    keep = np.zeros(len(probs), dtype=bool)
+    keep[np.argpartition(-probs, n_rups - 1)[:n_rups]] = True
+
+    counts = np.add.reduceat(keep.astype(int), offsets[:-1])
+    return (ruptures[keep], grp_ids[counts > 0],
+            np.cumsum([0, *counts[counts > 0]]))
+
+
+def _split_by_grp(ruptures: np.recarray, grp_ids: np.ndarray,
+                  offsets: np.ndarray) -> dict:
+    """Contexts by group as slices, i.e., views, of the rupture table"""
+    return {grp_id: ruptures[start:stop] for grp_id, start, stop
+            in zip(grp_ids.tolist(), offsets[:-1], offsets[1:])}
+
+
+def get_hazard_curves_from_dstore(
+    dstore_path: Union[str, Path],
+    poes: List[float],
+    site_ids: List[int] = None,
+    imts: List[str] = None,
+    batched: bool = False,
+    chunk_size: int = 1000
+) -> dict:
+    """
+    Reads hazard curves directly from an OpenQuake datastore.
+
+    This is the datastore counterpart of
+    `djura.hazard.psha.proc_oq_hazard_curve`, skipping the export of the
+    hazard curves to CSV files. The mean hazard curves (`hcurves-stats`) are
+    used if available, otherwise the curves of the only realization
+    (`hcurves-rlzs`). The curves are sliced from the HDF5 file by IMT and by
+    chunks of sites.
+
+    Parameters
+    ----------
+    dstore_path : str or Path
+        Path to the OpenQuake datastore (`.hdf5`) file.
+    poes : List[float]
+        List of probabilities of exceedance in the investigation time for
+        which corresponding IMLs will be obtained via interpolation.
+    site_ids : List[int], optional
+        IDs of the sites to read. If None, all sites are read.
+    imts : List[str], optional
+        IMTs to read, e.g. ['PGA', 'SA(0.5)']. If None, all IMTs are read.
+    batched : bool, optional
+        If True, the results are indexed by site, see
+        `proc_oq_hazard_curve`. By default False.
+    chunk_size : int, optional
+        Number of sites read from the datastore at once. Default is 1000.
+
+    Returns
+    -------
+    dict
+        Hazard curve data with the same structure as the output of
+        `proc_oq_hazard_curve`.
+
+    Raises
+    ------
+    ValueError
+        If any of `imts` is not available in the datastore, or if the
+        statistics of the hazard curves do not include the mean.
+
+    Example
+    -------
+    >>> hz = get_hazard_curves_from_dstore("calc_2.hdf5", [0.1, 0.02])
+    >>> hz["cond_imls"]["SA(0.5)"]
+    """
+    dstore = DataStore(str(dstore_path), mode='r')
+
+    try:
+        oq = dstore["oqparam"]
+        sitecol = dstore['sitecol'].complete.array
+
+        if 'hcurves-stats' in dstore:  # shape (N, S, M, L1)
+            dset = dstore.hdf5['hcurves-stats']
+            k = _get_mean_index(dset, oq)
+        else:  # there is only 1 realization
+            dset = dstore.hdf5['hcurves-rlzs']
+            k = 0
+
+        available = list(oq.imtls)
+        if imts is None:
+            imts = available
+        for imt in imts:
+            if imt not in available:
+                raise ValueError(f"IMT: {imt} not in the list of available "
+                                 "IMs, adjust input!")
+
+        if site_ids is None:
+            site_ids = np.arange(len(sitecol))
+        site_ids = np.asarray(site_ids)
+        # HDF5 selections must be increasing
+        order = np.argsort(site_ids, kind='stable')
+        sorted_ids = site_ids[order]
+
+        blocks = []
+        for imt in imts:
+            m = available.index(imt)
+            poe = np.empty((len(site_ids), dset.shape[-1]))
+            for start in range(0, len(sorted_ids), chunk_size):
+                chunk = sorted_ids[start:start + chunk_size]
+                unique_ids, inverse = np.unique(chunk, return_inverse=True)
+                poe[order[start:start + chunk_size]] = \
+                    dset[unique_ids.tolist(), k, m, :][inverse]
+            poe[~np.isfinite(poe)] = np.nan
+
+            blocks.append({
+                "im": imt,
+                "investigation_time": oq.investigation_time,
+                "lon": sitecol['lon'][site_ids].tolist(),
+                "lat": sitecol['lat'][site_ids].tolist(),
+                "iml": np.asarray(oq.imtls[imt]),
+                "poe": poe,
+            })
+    finally:
+        dstore.close()
+
+    if batched:
+        return _proc_hazard_curve_blocks(poes, blocks)
+    return _proc_hazard_curve_sites(poes, blocks)
+
+
+def _get_mean_index(dset: h5py.Dataset, oq) -> int:
+    """Index of the mean along the statistics (last) axis of a `*-stats`
+    dataset of the datastore
+    """
+    if 'json' in dset.attrs:
+        stats = json.loads(dset.attrs['json'])['stat']
+    else:
+        # e.g. disagg-stats, where OpenQuake stores only the mean
+        stats = ['mean'] if 'mean' in oq.hazard_stats() else []
+
+    if 'mean' not in stats:
+        raise ValueError(f"No mean statistic in {dset.name} of the "
+                         "datastore!")
+    return stats.index('mean')
+
+
+def get_disaggregation_from_dstore(
+    dstore_path: Union[str, Path],
+    poes: List[float] = None,
+    site_id: int = 0,
+    out_file: Union[str, Path] = None,
+    tol: float = 0.05
+) -> dict:
+    """
+    Reads magnitude-distance disaggregation results directly from an
+    OpenQuake datastore.
+
+    This is the datastore counterpart of
+    `djura.hazard.psha.proc_oq_disaggregation`, skipping the export of the
+    `Mag_Dist` disaggregation to CSV files. The mean disaggregation matrices
+    (`disagg-stats`) are used if available, otherwise those of the first
+    realization (`disagg-rlzs`), and the magnitude and distance bin centres
+    are computed from the bin edges (`disagg-bins`).
+
+    Parameters
+    ----------
+    dstore_path : str or Path
+        Path to the OpenQuake datastore (`.hdf5`) file.
+    poes : List[float], optional
+        List of probabilities of exceedance to compute occurrence
+        disaggregation. If None, only exceedance disaggregation is processed.
+    site_id : int, optional
+        Index of the site for which the disaggregation is read.
+        Default is 0 (first site in the datastore).
+    out_file : str or Path, optional
+        Path to the output JSON (or HDF5 if its suffix is .hdf5 or .h5) file
+        where the processed results will be stored. If None, the results are
+        not saved to file.
+    tol : float, optional
+        Tolerance used to match provided poes with existing disaggregation
+        poes when computing occurrence disaggregation. Default is 0.05.
+
+    Returns
+    -------
+    dict
+        Disaggregation data with the same structure as the output of
+        `proc_oq_disaggregation`.
+
+    Raises
+    ------
+    ValueError
+        If the datastore does not contain a `Mag_Dist` disaggregation
+        computed at given poes (`poes_disagg`), or if its statistics do not
+        include the mean.
+
+    Example
+    -------
+    >>> disagg = get_disaggregation_from_dstore("calc_2.hdf5")
+    >>> disagg["imt_disagg"]["SA(0.5)"]["mean_mags"]
+    """
+    dstore = DataStore(str(dstore_path), mode='r')
+
+    try:
+        oq = dstore["oqparam"]
+        if not len(oq.poes):
+            raise ValueError("Disaggregation by iml_disagg is not supported, "
+                             "poes_disagg are required!")
+
+        if 'disagg-stats/Mag_Dist' in dstore:
+            dset = dstore.hdf5['disagg-stats/Mag_Dist']
+            k = _get_mean_index(dset, oq)
+        elif 'disagg-rlzs/Mag_Dist' in dstore:
+            dset = dstore.hdf5['disagg-rlzs/Mag_Dist']
+            k = 0
+        else:
+            raise ValueError("Mag_Dist disaggregation not in the datastore!")
+
+        # shape (Mag, Dist, M, P), mean or first realization
+        matrix = dset[site_id, ..., k]
+        mag_edges = dstore['disagg-bins/Mag'][:]
+        dist_edges = dstore['disagg-bins/Dist'][:]
+        sitecol = dstore['sitecol'].complete.array
+    finally:
+        dstore.close()
+
+    mags = (mag_edges[:-1] + mag_edges[1:]) / 2
+    dists = (dist_edges[:-1] + dist_edges[1:]) / 2
+
+    # Columns ordered as in the CSV exports, i.e. by imt, poe, mag and dist
+    imt, poe, mag, dist = (
+        col.ravel() for col in np.meshgrid(
+            np.array(list(oq.imtls)), oq.poes, mags, dists, indexing='ij')
+    )
+    gamma = matrix.transpose(2, 3, 0, 1).ravel()
+
+    disagg = {
+        "location": {
+            "lat": float(sitecol['lat'][site_id]),
+            "lon": float(sitecol['lon'][site_id]),
+        },
+        "investigation_time": oq.investigation_time,
+        "imt_disagg": _reduce_disagg(
+            oq.investigation_time, imt, poe, mag, dist, gamma
+        )
+    }
+
+    if poes:
+        _add_occurrence_disagg(disagg, poes, tol)
+
+    # Zero contribution bins are dropped while building the sparse results
+    _sparsify_disagg(disagg)
+
+    # Save the output dictionary as a JSON (or HDF5) file
+    if out_file is not None:
+        _save_output(out_file, disagg)
+
+    return disagg
+
+
+class RuptureMatcher:
+    """Nearest rupture of the contexts to target scenarios, e.g. the
+    magnitude-distance bins of a disaggregation
+
+    The rupture parameters used for matching are normalised once to [0, 1]
+    by their range in the contexts, and indexed with a KD-tree. All targets
+    are matched in a single batched query.
+
+    Parameters
+    ----------
+    ruptures : np.recarray or LazyContext
+        Rupture contexts, e.g. `ruptures` of `get_context_from_dstore`.
+    params : List[str], optional
+        Rupture parameters used for matching, by default magnitude and
+        Joyner-Boore distance.
+
+    Example
+    -------
+    >>> matcher = RuptureMatcher(ctx['ruptures'])
+    >>> matched = matcher.query(
+    ...     {'mag': disagg['mag'], 'rjb': disagg['dist']},
+    ...     ctx['required-parameters'])
+    """
+
+    def __init__(self, ruptures: Union[np.recarray, LazyContext],
+                 params: List[str] = ('mag', 'rjb')):
+        self.ruptures = ruptures
+        self.params = list(params)
+
+        values = np.column_stack(
+            [np.asarray(ruptures[param], dtype=float)
+             for param in self.params])
+        self.lower = values.min(axis=0)
+        self.scale = values.max(axis=0) - self.lower
+        # Constant parameters do not affect the matching
+        self.scale[self.scale == 0] = 1.
+        self.tree = cKDTree((values - self.lower) / self.scale)
+
+    def query(self, targets: dict, fields: List[str] = None) -> dict:
+        """Matches the targets to their nearest ruptures
+
+        Parameters
+        ----------
+        targets : dict
+            Values of the matching parameters of each target, by parameter
+        fields : List[str], optional
+            Parameters of the matched ruptures to return, e.g. the
+            `required-parameters` of the GSIMs. If None, the matching
+            parameters.
+
+        Returns
+        -------
+        dict
+            Index of the matched ruptures (`index`), their normalised
+            distance to the targets (`distance`), and the values of
+            `fields` of the matched ruptures
+        """
+        points = np.column_stack(
+            [np.asarray(targets[param], dtype=float)
+             for param in self.params])
+        distance, index = self.tree.query((points - self.lower) / self.scale)
+
+        fields = self.params if fields is None else fields
+        return {
+            'index': index,
+            'distance': distance,
+            **{field: np.asarray(self.ruptures[field])[index]
+               for field in fields},
+        }
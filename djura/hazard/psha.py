@@ -1,17 +1,26 @@
 from pathlib import Path
-from typing import List
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import List, Tuple
 from scipy.interpolate import interp1d
-from pandas import read_csv, DataFrame
+from pandas import read_csv
+import numpy.lib.recfunctions as rfn
 import numpy as np
-import json
+import ast
+import re
+
+from djura.utilities import map_parallel, write_hdf5, write_json
 
 
 def proc_oq_hazard_curve(
     poes: list[float],
     path_hazard_results: str | Path,
     out_file: str | Path = None,
-    haz_file_start: str = 'hazard_curve-mean'
-) -> None:
+    haz_file_start: str = 'hazard_curve-mean',
+    batched: bool = False,
+    backend: str = None,
+    max_workers: int = None
+) -> dict:
     """
     Process OpenQuake hazard curve results and store them in a JSON file.
 
@@ -33,14 +42,26 @@ def proc_oq_hazard_curve(
     json_file : str | Path, optional
         Path and name of the output JSON file where the processed data will
         be saved. By default, it is saved as 'hazard.json'.
+        If its suffix is .hdf5 or .h5, the data is saved in a binary HDF5
+        layout instead, see `djura.utilities.read_hdf5`.
     haz_file_start : str, optional
         Prefix for the hazard curve files to process. Only files that start
         with this prefix will be processed. By default, this is set to
         'hazard_curve-mean'.
+    batched : bool, optional
+        If True, each hazard curve file is processed as a single
+        (sites x levels) block and the results are indexed by site, which
+        is required for multi-site exports. By default False.
+    backend : str, optional
+        'process' or 'thread' to parse the hazard curve files concurrently,
+        by default None (files are parsed one after another).
+    max_workers : int, optional
+        Maximum number of workers when `backend` is provided.
 
     Returns
     -------
-    None
+    dict
+        Processed hazard curve data.
 
     Notes
     -----
@@ -59,6 +80,12 @@ def proc_oq_hazard_curve(
     - `hazard_curves`: A dictionary containing hazard curve data for each IM,
     including the original probabilities of exceedance and IMLs.
 
+    In batched mode, `lat` and `lon` hold one entry per site and `im` one
+    entry per IM. For each IM, `cond_imls` is a (sites x poes) array and
+    `hazard_curves` holds the shared `iml` vector and a (sites x levels)
+    `poe` array, where infinite or NaN values are masked as NaN. IMLs of
+    poes outside the range of a site's hazard curve are set to NaN.
+
     Example
     -------
     To process hazard curve files in a directory and save them in a JSON file,
@@ -73,6 +100,119 @@ def proc_oq_hazard_curve(
     # Convert paths to Path objects
     path_hazard_results = Path(path_hazard_results)
 
+    files = [file for file in sorted(path_hazard_results.iterdir())
+             if file.name.startswith(haz_file_start)]
+
+    # Parse the files, results are merged in the (sorted) order of the files
+    blocks = map_parallel(_read_hazard_curve_file, files, backend,
+                          max_workers)
+
+    if batched:
+        output_data = _proc_hazard_curve_blocks(poes, blocks)
+    else:
+        output_data = _proc_hazard_curve_sites(poes, blocks)
+
+    # Save the output dictionary as a JSON (or HDF5) file
+    if out_file is not None:
+        _save_output(out_file, output_data)
+
+    return output_data
+
+
+def read_oq_csv(file: str | Path) -> Tuple[dict, np.ndarray]:
+    """Reads an OpenQuake CSV export, metadata header and body, in a single
+    pass
+
+    Parameters
+    ----------
+    file : str | Path
+        OpenQuake CSV output, e.g. hazard curve or disaggregation file
+
+    Returns
+    -------
+    Tuple[dict, np.ndarray]
+        A tuple containing:
+        - Metadata of the header line, with values converted to Python
+        types where possible (e.g. `investigation_time`, `lon`, `lat` as
+        floats, `imt` as a string, bin edges as lists)
+        - Body of the file as a structured array, one field per column
+
+    Example
+    -------
+    >>> meta, data = read_oq_csv('Mag_Dist-0_2.csv')
+    >>> meta['investigation_time'], meta['lon'], meta['lat']
+    (50.0, 13.3999, 42.3507)
+    >>> data['mag']
+    """
+    with Path(file).open("r") as f:
+        header = f.readline()
+        data = read_csv(f).to_records(index=False)
+
+    metadata = {}
+    for key, value in re.findall(r"(\w+)=('[^']*'|\[[^\]]*\]|[^,\"]*)",
+                                 header):
+        try:
+            metadata[key] = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            metadata[key] = value.strip()
+
+    return metadata, data
+
+
+def _save_output(out_file: str | Path, data: dict):
+    """Saves processed results as HDF5 if the suffix of the output file is
+    .hdf5 or .h5, otherwise as JSON
+    """
+    out_file = Path(out_file)
+
+    if out_file.suffix.lower() in [".hdf5", ".h5"]:
+        write_hdf5(out_file, data)
+    else:
+        write_json(out_file, data, indent=4)
+
+
+def _read_hazard_curve_file(file: Path) -> dict:
+    """Reads an OpenQuake hazard curve file as a (sites x levels) block
+
+    Parameters
+    ----------
+    file : Path
+        Hazard curve file, e.g. hazard_curve-mean-SA(0.5)_2.csv
+
+    Returns
+    -------
+    dict
+        IM type, investigation time, site coordinates, IMLs and the
+        (sites x levels) poe block with infinite or NaN values set to NaN
+    """
+    # Strip the IM out of the file name
+    items = (file.stem.split('-')[2]).split('_')
+    im_type = "_".join(items[:-1])  # Join later for Sa_Avg
+
+    metadata, data = read_oq_csv(file)
+
+    # Get the column headers and strip out the actual IM values
+    poe_cols = list(data.dtype.names[3:])
+    iml = np.array([float(i[4:]) for i in poe_cols])
+
+    # Mask any infinite or nan value of the whole block at once
+    poe = rfn.structured_to_unstructured(data[poe_cols], dtype=float)
+    poe[~np.isfinite(poe)] = np.nan
+
+    return {
+        "im": im_type,
+        "investigation_time": float(metadata["investigation_time"]),
+        "lon": data["lon"].tolist(),
+        "lat": data["lat"].tolist(),
+        "iml": iml,
+        "poe": poe,
+    }
+
+
+def _proc_hazard_curve_sites(poes: List[float], blocks: List[dict]) -> dict:
+    """Assembles hazard curve outputs site by site from (sites x levels)
+    blocks, see `proc_oq_hazard_curve`
+    """
     # Initialise dictionary to store all outputs
     output_data = {
         "investigation_time": None,  # Will be set when reading files
@@ -84,78 +224,127 @@ def proc_oq_hazard_curve(
         "hazard_curves": {}
     }
 
-    # Read through each file in the outputs folder
-    for file in path_hazard_results.iterdir():
-        if file.name.startswith(haz_file_start):
-
-            # Strip the IM out of the file name
-            items = (file.stem.split('-')[2]).split('_')
-            im_type = "_".join(items[:-1])  # Join later for Sa_Avg
-
-            # Load the results in as a dataframe
-            df = read_csv(file, skiprows=1)
-
-            # Get the column headers
-            iml = list(df.columns.values)[3:]  # List of headers
-            iml = [float(i[4:]) for i in iml]  # Strip out the actual IM values
-
-            with file.open("r") as f:
-                temp1 = f.readline().split(',')
-                temp2 = list(filter(None, temp1))
-                inv_t = float(list(filter(
-                    lambda x: 'investigation_time=' in x, temp2
-                ))[0].replace(" investigation_time=", ""))
-
-                # Save inv_t once (assuming it is consistent across files)
-                output_data["investigation_time"] = inv_t
-
-            # For each of the sites investigated
-            for site in np.arange(len(df)):
-
-                # Append each site's info to the output dictionary
-                output_data["lat"].append([df.lat[site]][0])
-                output_data["lon"].append([df.lon[site]][0])
-                output_data["im"].append(im_type)
-
-                # Get the array of poe in inv_t and corresponding imls
-                tmp1 = np.array(df.iloc[site, 3:].values)
-                tmp2 = np.array(iml)
-                # get rid of any infinite or nan value
-                infs = np.isinf(tmp1)
-                tmp1 = tmp1[~infs]
-                tmp2 = tmp2[~infs]
-                nans = np.isnan(tmp1)
-                tmp1 = tmp1[~nans]
-                tmp2 = tmp2[~nans]
-
-                # Save hazard curve data in the dictionary
-                output_data["hazard_curves"][f"{im_type}"] = {
-                    "poe": tmp1.tolist(),
-                    "iml": tmp2.tolist(),
-                }
+    # Read through the hazard curves of each IM
+    for block in blocks:
+        im_type = block["im"]
+
+        # Save inv_t once (assuming it is consistent across files)
+        output_data["investigation_time"] = block["investigation_time"]
+
+        # For each of the sites investigated
+        for site in range(len(block["poe"])):
+
+            # Append each site's info to the output dictionary
+            output_data["lat"].append(block["lat"][site])
+            output_data["lon"].append(block["lon"][site])
+            output_data["im"].append(im_type)
+
+            # get rid of any infinite or nan value
+            valid = ~np.isnan(block["poe"][site])
+
+            # Save hazard curve data in the dictionary
+            output_data["hazard_curves"][f"{im_type}"] = {
+                "poe": block["poe"][site][valid].tolist(),
+                "iml": block["iml"][valid].tolist(),
+            }
 
     # Get intensity measure levels corresponding to poes and store in
     # dictionary
-    for idx, im in enumerate(output_data["hazard_curves"]):
+    for im in output_data["hazard_curves"]:
         poe = output_data["hazard_curves"][im]["poe"]
         iml = output_data["hazard_curves"][im]["iml"]
         iml_interp = interp1d(poe, iml, kind='linear')(poes)
-        output_data["cond_imls"][output_data["im"][idx]] = iml_interp.tolist()
+        output_data["cond_imls"][im] = iml_interp.tolist()
 
-    # Save the output dictionary as a JSON file
-    if out_file is not None:
-        out_file = Path(out_file)
+    return output_data
 
-        with open(out_file, 'w') as file:
-            json.dump(output_data, file, indent=4)
+
+def _proc_hazard_curve_blocks(poes: List[float], blocks: List[dict]) -> dict:
+    """Assembles site-indexed hazard curve outputs from (sites x levels)
+    blocks, see `proc_oq_hazard_curve`
+    """
+    output_data = {
+        "investigation_time": None,
+        "lat": [],
+        "lon": [],
+        "im": [],
+        "cond_poes": poes,
+        "cond_imls": {},
+        "hazard_curves": {}
+    }
+
+    for block in blocks:
+        im_type = block["im"]
+
+        if not output_data["im"]:
+            output_data["lat"] = block["lat"]
+            output_data["lon"] = block["lon"]
+        elif len(block["lat"]) != len(output_data["lat"]):
+            raise ValueError(f"Number of sites for {im_type} differs from "
+                             "the other hazard curve files!")
+
+        output_data["investigation_time"] = block["investigation_time"]
+        output_data["im"].append(im_type)
+        output_data["hazard_curves"][im_type] = {
+            "poe": block["poe"],
+            "iml": block["iml"],
+        }
+        output_data["cond_imls"][im_type] = _interp_iml_block(
+            block["poe"], block["iml"], poes)
 
     return output_data
 
 
+def _interp_iml_block(
+    poe: np.ndarray,
+    iml: np.ndarray,
+    poes: List[float]
+) -> np.ndarray:
+    """Linearly interpolates IMLs at target poes for all sites at once
+
+    Parameters
+    ----------
+    poe : np.ndarray
+        (sites x levels) poes, non-increasing along the levels, NaN if masked
+    iml : np.ndarray
+        IMLs of the levels
+    poes : List[float]
+        Target poes
+
+    Returns
+    -------
+    np.ndarray
+        (sites x poes) IMLs, NaN if a poe is outside of the hazard curve
+    """
+    target = np.asarray(poes, dtype=float)
+    n_levels = poe.shape[1]
+
+    # Number of levels with a poe at least equal to each target poe
+    count = np.sum(poe[:, None, :] >= target[None, :, None], axis=2)
+    hi = np.clip(count, 1, n_levels - 1)
+    lo = hi - 1
+
+    poe_lo = np.take_along_axis(poe, lo, axis=1)
+    poe_hi = np.take_along_axis(poe, hi, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = (poe_lo - target) / (poe_lo - poe_hi)
+    iml_interp = iml[lo] + w * (iml[hi] - iml[lo])
+
+    # fmax and fmin skip NaN levels, and return NaN without warnings for
+    # fully masked sites, whose IMLs are NaN anyway
+    outside = (target > np.fmax.reduce(poe, axis=1)[:, None]) | \
+        (target < np.fmin.reduce(poe, axis=1)[:, None])
+    iml_interp[outside] = np.nan
+
+    return iml_interp
+
+
 def proc_oq_disaggregation_exc(
     path_disagg_results: str | Path,
     out_file: str | Path = None,
-    disagg_file_start: str = 'Mag_Dist'
+    disagg_file_start: str = 'Mag_Dist',
+    backend: str = None,
+    max_workers: int = None
 ) -> dict:
     """
     Process disaggregation results from OpenQuake and store them in a JSON
@@ -176,10 +365,19 @@ def proc_oq_disaggregation_exc(
         The output JSON file where the processed disaggregation data will be
         stored.
         Default is 'disaggregation.json'.
+        If its suffix is .hdf5 or .h5, the data is saved in a binary HDF5
+        layout instead, with one group per IMT and poe, see
+        `djura.utilities.read_hdf5`.
     disagg_file_start : str, optional
         Prefix of the disaggregation files to process. Files that begin with
         this prefix and do not contain 'Mag_Dist_Eps' will be processed.
         Default is 'Mag_Dist'.
+    backend : str, optional
+        'process' or 'thread' to process the disaggregation files
+        concurrently, by default None (files are processed one after
+        another).
+    max_workers : int, optional
+        Maximum number of workers when `backend` is provided.
 
     Returns
     -------
@@ -207,7 +405,7 @@ def proc_oq_disaggregation_exc(
         - `mag_dist_hazard_contributions`: A dictionary of hazard
         contributions for each poe,
           containing magnitudes, distances, and their respective hazard
-          contributions.
+          contributions as arrays.
 
     Example
     -------
@@ -224,119 +422,175 @@ def proc_oq_disaggregation_exc(
         "imt_disagg": {}
     }
 
-    for file in path_disagg_results.iterdir():
-        if file.name.startswith(disagg_file_start) and \
-           'eps' not in file.name.lower():
-            # Load the dataframe
-            df = read_csv(file, skiprows=1)
-
-            # Extract hazard key (column starting with 'rlz' or 'mean')
-            hz_key = next(key for key in df.keys()
-                          if key.startswith('rlz') or key == 'mean')
-
-            # Extract unique values for poes and imt
-            poes = np.unique(df['poe']).tolist()
-            poes.sort(reverse=True)
-            ims = np.unique(df['imt'])
-
-            # Extract salient information from the first line of the file
-            with file.open("r") as f:
-                first_line = f.readline().split(',')
-                lon = float(next(filter(lambda x: 'lon=' in x, first_line)
-                                 ).replace(" lon=", ""))
-                lat = float(next(filter(lambda x: 'lat=' in x, first_line)
-                                 ).replace(" lat=", "").replace("\"\n", "")
-                            .replace("\"", ""))
-                inv_t = float(next(filter(
-                    lambda x: 'investigation_time=' in x, first_line
-                )).replace(" investigation_time=", ""))
-
-                # Set lat, lon, and investigation time in the dictionary (once)
-                disagg["location"]["lat"] = lat
-                disagg["location"]["lon"] = lon
-                disagg["investigation_time"] = inv_t
-
-            # Loop through each intensity measure (imt)
-            for imt in ims:
-                disagg["imt_disagg"][imt] = {
-                    "poes": poes,
-                    "return_periods": [],
-                    "mean_mags": [],
-                    "mean_dists": [],
-                    "mod_mags": [],
-                    "mod_dists": [],
-                    "mag_dist_hazard_contributions": {},
-                }
-
-                # Loop through each probability of exceedance (poe)
-                for poe in poes:
-                    return_period = round(-inv_t / np.log(1 - poe))
-                    disagg["imt_disagg"][imt]["return_periods"].append(
-                        return_period)
-
-                    # Filter data for current poe and imt
-                    mag_data = df['mag'][(
-                        df['poe'] == poe) & (df['imt'] == imt)]
-                    dist_data = df['dist'][
-                        (df['poe'] == poe) & (df['imt'] == imt)]
-                    hz_cont_data = df[hz_key][
-                        (df['poe'] == poe) & (df['imt'] == imt)]
-                    # Normalize hazard contribution
-                    hz_cont_data_norm = hz_cont_data / hz_cont_data.sum()
-
-                    # Create a DataFrame to hold the magnitude, distance,
-                    # and hazard contribution
-                    data = DataFrame({
-                        "mag": mag_data,
-                        "dist": dist_data,
-                        "hz_cont_exc": hz_cont_data_norm
-                    })
-
-                    # Compute modal (highest hazard contribution) values
-                    mode = data.sort_values(by='hz_cont_exc', ascending=False
-                                            ).iloc[0]
-                    mode_mag = mode['mag']
-                    mode_dist = mode['dist']
-
-                    # Compute mean values
-                    mean_mag = np.sum(data['mag'] * data['hz_cont_exc'])
-                    mean_dist = np.sum(data['dist'] * data['hz_cont_exc'])
-
-                    disagg["imt_disagg"][imt]["mean_mags"].append(
-                        mean_mag)
-                    disagg["imt_disagg"][imt]["mean_dists"].append(
-                        mean_dist)
-                    disagg["imt_disagg"][imt]["mod_mags"].append(
-                        mode_mag)
-                    disagg["imt_disagg"][imt]["mod_dists"].append(
-                        mode_dist)
-
-                    # Store magnitude, distance, and hazard contribution in
-                    # the dictionary
-                    disagg["imt_disagg"][imt][
-                        "mag_dist_hazard_contributions"][f"poe_{poe}"] = {
-                        "mag": mag_data.tolist(),
-                        "dist": dist_data.tolist(),
-                        "hz_cont_exc": hz_cont_data_norm.tolist(),
-                        "gamma": hz_cont_data.tolist()
-                    }
+    files = [
+        file for file in sorted(path_disagg_results.iterdir())
+        if file.name.startswith(disagg_file_start) and
+        'eps' not in file.name.lower()
+    ]
+
+    # Parse the files, results are merged in the (sorted) order of the files
+    for file_disagg in map_parallel(_proc_disagg_file, files, backend,
+                                    max_workers):
+        disagg["location"] = file_disagg["location"]
+        disagg["investigation_time"] = file_disagg["investigation_time"]
+        disagg["imt_disagg"].update(file_disagg["imt_disagg"])
 
+    # Save the output dictionary as a JSON (or HDF5) file
     if out_file is not None:
-        out_file = Path(out_file)
+        _save_output(out_file, disagg)
 
-        # Save the output dictionary as a JSON file
-        with open(out_file, 'w') as file:
-            json.dump(disagg, file, indent=4)
+    return disagg
+
+
+def _proc_disagg_file(file: Path) -> dict:
+    """Processes a single OpenQuake disaggregation file, see
+    `proc_oq_disaggregation_exc`
+    """
+    disagg = {
+        "location": {"lat": None, "lon": None},
+        "investigation_time": None,
+        "imt_disagg": {}
+    }
+
+    # Read the metadata header and the body in a single pass
+    metadata, df = read_oq_csv(file)
+
+    # Extract hazard key (column starting with 'rlz' or 'mean')
+    hz_key = next(key for key in df.dtype.names
+                  if key.startswith('rlz') or key == 'mean')
+
+    # Set lat, lon, and investigation time in the dictionary
+    inv_t = float(metadata["investigation_time"])
+    disagg["location"]["lat"] = float(metadata["lat"])
+    disagg["location"]["lon"] = float(metadata["lon"])
+    disagg["investigation_time"] = inv_t
+
+    disagg["imt_disagg"] = _reduce_disagg(
+        inv_t, df['imt'], df['poe'], df['mag'], df['dist'], df[hz_key]
+    )
 
     return disagg
 
 
+def _reduce_disagg(
+    inv_t: float,
+    imt: np.ndarray,
+    poe: np.ndarray,
+    mag: np.ndarray,
+    dist: np.ndarray,
+    gamma: np.ndarray
+) -> dict:
+    """Computes the exceedance disaggregation statistics of all
+    (imt, poe) slices at once
+
+    The rows are sorted once by (imt, poe) and the normalised contributions,
+    mean and modal magnitudes and distances are obtained through segmented
+    reductions over the contiguous slices.
+
+    Parameters
+    ----------
+    inv_t : float
+        Investigation time
+    imt : np.ndarray
+        IMT of each magnitude-distance bin
+    poe : np.ndarray
+        Disaggregation poe of each magnitude-distance bin
+    mag : np.ndarray
+        Magnitude of each bin
+    dist : np.ndarray
+        Distance of each bin
+    gamma : np.ndarray
+        Hazard contribution (exceedance) of each bin
+
+    Returns
+    -------
+    dict
+        Disaggregation results by IMT, see `imt_disagg` of
+        `proc_oq_disaggregation_exc`
+    """
+    imts, imt_idx = np.unique(imt, return_inverse=True)
+    poes_asc, poe_idx = np.unique(poe, return_inverse=True)
+    n_poes = len(poes_asc)
+    # poes are reported in descending order
+    poes = poes_asc[::-1].tolist()
+    poe_idx = n_poes - 1 - poe_idx
+
+    # Sort once by (imt, poe), keeping the order of the bins in each slice
+    key = imt_idx.ravel() * n_poes + poe_idx.ravel()
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    mag = np.asarray(mag, dtype=float)[order]
+    dist = np.asarray(dist, dtype=float)[order]
+    gamma = np.asarray(gamma, dtype=float)[order]
+
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    stops = np.r_[starts[1:], len(key)]
+    lengths = stops - starts
+
+    # Normalize hazard contribution
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hz_cont = gamma / np.repeat(np.add.reduceat(gamma, starts), lengths)
+
+    # Compute mean values
+    mean_mags = np.add.reduceat(mag * hz_cont, starts)
+    mean_dists = np.add.reduceat(dist * hz_cont, starts)
+
+    # Compute modal (first bin with highest hazard contribution) values
+    is_max = hz_cont == np.repeat(np.maximum.reduceat(hz_cont, starts),
+                                  lengths)
+    max_pos = np.flatnonzero(is_max)
+    first = np.minimum(np.searchsorted(max_pos, starts), len(max_pos) - 1)
+    mode_idx = max_pos[first] if len(max_pos) else starts
+    # slices without contributions fall back to their first bin
+    mode_idx = np.where((mode_idx >= starts) & (mode_idx < stops),
+                        mode_idx, starts)
+
+    # Statistics of each (imt, poe) pair, NaN if the pair is missing
+    stats = {}
+    for name, values in zip(
+        ["mean_mags", "mean_dists", "mod_mags", "mod_dists"],
+        [mean_mags, mean_dists, mag[mode_idx], dist[mode_idx]]
+    ):
+        stats[name] = np.full(len(imts) * n_poes, np.nan)
+        stats[name][key[starts]] = values
+        stats[name] = stats[name].reshape(len(imts), n_poes)
+
+    return_periods = [round(-inv_t / np.log(1 - poe)) for poe in poes]
+
+    imt_disagg = {}
+    for i, imt in enumerate(imts):
+        imt_disagg[imt] = {
+            "poes": poes,
+            "return_periods": return_periods,
+            "mean_mags": stats["mean_mags"][i].tolist(),
+            "mean_dists": stats["mean_dists"][i].tolist(),
+            "mod_mags": stats["mod_mags"][i].tolist(),
+            "mod_dists": stats["mod_dists"][i].tolist(),
+            "mag_dist_hazard_contributions": {},
+        }
+
+    # Store magnitude, distance, and hazard contribution of each slice
+    for seg_key, start, stop in zip(key[starts], starts, stops):
+        imt = imts[seg_key // n_poes]
+        poe = poes[seg_key % n_poes]
+        imt_disagg[imt]["mag_dist_hazard_contributions"][f"poe_{poe}"] = {
+            "mag": mag[start:stop],
+            "dist": dist[start:stop],
+            "hz_cont_exc": hz_cont[start:stop],
+            "gamma": gamma[start:stop]
+        }
+
+    return imt_disagg
+
+
 def proc_oq_disaggregation_occ(
     poes: List[float],
     path_disagg_results: str | Path,
     out_file: str | Path = None,
     disagg_file_start: str = 'Mag_Dist',
-    tol: float = 0.05
+    tol: float = 0.05,
+    backend: str = None,
+    max_workers: int = None
 ) -> dict:
     """
     Process exceedance disaggregation results from OpenQuake, and computes
@@ -365,10 +619,22 @@ def proc_oq_disaggregation_occ(
         The output JSON file where the processed disaggregation data will be
         stored.
         Default is 'disaggregation.json'.
+        If its suffix is .hdf5 or .h5, the data is saved in a binary HDF5
+        layout instead, with one group per IMT and poe, see
+        `djura.utilities.read_hdf5`.
     disagg_file_start : str, optional
         Prefix of the disaggregation files to process. Files that begin with
         this prefix and do not contain 'Mag_Dist_Eps' will be processed.
         Default is 'Mag_Dist'.
+    tol : float, optional
+        Relative tolerance between each poe and the closest smaller
+        disaggregation poe. Default is 0.05.
+    backend : str, optional
+        'process' or 'thread' to process the disaggregation files
+        concurrently, by default None (files are processed one after
+        another).
+    max_workers : int, optional
+        Maximum number of workers when `backend` is provided.
 
     References
     ----------
@@ -402,7 +668,7 @@ def proc_oq_disaggregation_occ(
         - `mag_dist_hazard_contributions`: A dictionary of hazard
         contributions for each poe, containing magnitudes, distances, and
         their respective hazard contributions in terms of exceedances
-        and occurrences.
+        and occurrences as arrays.
 
     Example
     -------
@@ -415,51 +681,71 @@ def proc_oq_disaggregation_occ(
     """
 
     disagg = proc_oq_disaggregation_exc(
-        path_disagg_results, None, disagg_file_start
+        path_disagg_results, None, disagg_file_start, backend, max_workers
     )
 
-    imts = list(disagg["imt_disagg"].keys())
-
-    for imt in imts:
-        data = disagg["imt_disagg"][imt]
-        for target in poes:
-            closest = [v for v in data["poes"] if v < target]
-            if not closest:
-                raise ValueError(
-                    f"There is no smaller PoE than {target} "
-                    "in disaggregation."
-                )
-            else:
-                closest = max(closest)
-                if (target - closest) / target > tol:
-                    raise ValueError(
-                        f"Add a close PoE to {target} to disaggregation PoEs"
-                    )
-            gamma_i = np.array(
-                data["mag_dist_hazard_contributions"][f"poe_{target}"]["gamma"]
+    _add_occurrence_disagg(disagg, poes, tol)
+
+    # Save the output dictionary as a JSON (or HDF5) file
+    if out_file is not None:
+        _save_output(out_file, disagg)
+
+    return disagg
+
+
+def _add_occurrence_disagg(disagg: dict, poes: List[float], tol: float):
+    """Adds the occurrence contributions (`hz_cont_occ`) at the given poes
+    to exceedance disaggregation results, see `proc_oq_disaggregation_occ`
+    """
+    targets = np.asarray(poes, dtype=float)
+
+    # IMTs sharing the same disaggregation poes are processed together
+    imts_by_poes = {}
+    for imt, data in disagg["imt_disagg"].items():
+        imts_by_poes.setdefault(tuple(data["poes"]), []).append(imt)
+
+    for data_poes, imts in imts_by_poes.items():
+        # Binary search for each target and the next-smaller poe
+        poes_asc = np.sort(data_poes)
+        pos = np.searchsorted(poes_asc, targets)
+        missing = poes_asc[np.minimum(pos, len(poes_asc) - 1)] != targets
+        if missing.any():
+            raise ValueError(
+                f"PoE {targets[missing][0]} is not in disaggregation PoEs"
             )
-            gamma_i_1 = np.array(
-                data["mag_dist_hazard_contributions"][f"poe_{closest}"][
-                    "gamma"
-                ]
+        if (pos == 0).any():
+            raise ValueError(
+                f"There is no smaller PoE than {targets[pos == 0][0]} "
+                "in disaggregation."
             )
-            prob_im_m_r = (gamma_i_1 - gamma_i) / (
-                np.sum(gamma_i_1) - np.sum(gamma_i)
+        closest = poes_asc[pos - 1]
+        too_far = (targets - closest) / targets > tol
+        if too_far.any():
+            raise ValueError(
+                f"Add a close PoE to {targets[too_far][0]} to "
+                "disaggregation PoEs"
             )
-            # not required but let's make sure
-            prob_im_m_r /= np.sum(prob_im_m_r)
-            disagg["imt_disagg"][imt]["mag_dist_hazard_contributions"][
-                f"poe_{target}"
-            ]["hz_cont_occ"] = list(prob_im_m_r)
 
-    if out_file is not None:
-        out_file = Path(out_file)
+        # Indices within the disaggregation poes (descending order)
+        target_idx = len(data_poes) - 1 - pos
+        closest_idx = target_idx + 1
 
-        # Save the output dictionary as a JSON file
-        with open(out_file, 'w') as file:
-            json.dump(disagg, file, indent=4)
+        # Rates of exceedance as a dense (imt x poe x bin) tensor
+        gamma = np.array([
+            [disagg["imt_disagg"][imt]["mag_dist_hazard_contributions"][
+                f"poe_{poe}"]["gamma"] for poe in data_poes]
+            for imt in imts
+        ])
 
-    return disagg
+        # Fox et al. (2016) for all IMTs and target poes at once
+        prob_im_m_r = gamma[:, closest_idx] - gamma[:, target_idx]
+        prob_im_m_r /= np.sum(prob_im_m_r, axis=-1, keepdims=True)
+
+        for i, imt in enumerate(imts):
+            data = disagg["imt_disagg"][imt]["mag_dist_hazard_contributions"]
+            for j, idx in enumerate(target_idx):
+                data[f"poe_{data_poes[idx]}"]["hz_cont_occ"] = \
+                    prob_im_m_r[i, j]
 
 
 def proc_oq_disaggregation(
@@ -468,6 +754,8 @@ def proc_oq_disaggregation(
     out_file: str | Path = None,
     disagg_file_start: str = "Mag_Dist",
     tol: float = 0.05,
+    backend: str = None,
+    max_workers: int = None
 ) -> dict:
     """
     Wrapper function to process disaggregation results from OpenQuake and store
@@ -484,7 +772,8 @@ def proc_oq_disaggregation(
     - If `poes` is not provided, it computes only exceedance disaggregation.
 
     It also removes magnitude-distance bins with zero hazard contributions
-    to clean up the final data structure.
+    to clean up the final data structure, storing the hazard contributions of
+    each IMT as sparse `MagDistContributions`.
 
     Parameters
     ----------
@@ -497,6 +786,9 @@ def proc_oq_disaggregation(
     out_file : str | Path, optional
         Path to the output JSON file where the processed results will be
         stored. If None, the results are not saved to file.
+        If its suffix is .hdf5 or .h5, the data is saved in a binary HDF5
+        layout instead, with one group per IMT and poe, see
+        `djura.utilities.read_hdf5`.
     disagg_file_start : str, optional
         Prefix used to identify relevant disaggregation result files.
         Files must start with this prefix and exclude 'Mag_Dist_Eps'.
@@ -504,6 +796,12 @@ def proc_oq_disaggregation(
     tol : float, optional
         Tolerance used to match provided poes with existing disaggregation poes
         when computing occurrence disaggregation. Default is 0.05.
+    backend : str, optional
+        'process' or 'thread' to process the disaggregation files
+        concurrently, by default None (files are processed one after
+        another).
+    max_workers : int, optional
+        Maximum number of workers when `backend` is provided.
 
     Returns
     -------
@@ -521,13 +819,16 @@ def proc_oq_disaggregation(
     (IMT), containing:
         - `poes`, `return_periods`, `mean_mags`, `mean_dists`,
           `mod_mags`, `mod_dists`
-        - `mag_dist_hazard_contributions`: Dictionary with disaggregated hazard
-          data per PoE, including:
+        - `mag_dist_hazard_contributions`: `MagDistContributions` with
+          disaggregated hazard data per PoE, including:
             - `mag`, `dist`: Bin edges
             - `hz_cont_exc`: Hazard contributions (exceedance)
             - `hz_cont_occ`: Hazard contributions (occurrence, if poes given)
             - `gamma`: Rate of exceedances for given mag and dist pair
 
+      The contributions are read-only, assigning a poe, a contribution type
+      or an array element raises an error instead of being dropped.
+
     Example
     -------
     >>> proc_oq_disaggregation('results/disagg')
@@ -536,34 +837,130 @@ def proc_oq_disaggregation(
 
     if poes:
         disagg = proc_oq_disaggregation_occ(
-            poes, path_disagg_results, out_file, disagg_file_start, tol
+            poes, path_disagg_results, None, disagg_file_start, tol,
+            backend, max_workers
         )
     else:
         disagg = proc_oq_disaggregation_exc(
-            path_disagg_results, out_file, disagg_file_start
+            path_disagg_results, None, disagg_file_start, backend,
+            max_workers
         )
 
-    imts = list(disagg["imt_disagg"].keys())
-    for imt in imts:
-        data = disagg["imt_disagg"][imt]["mag_dist_hazard_contributions"]
-        poe_keys = list(data.keys())
-        for poe in poe_keys:
-            keys_to_filter = ["mag", "dist", "hz_cont_exc", "gamma"]
-            if "hz_cont_occ" in data[poe]:
-                valid_indices = [
-                    i for i, hz in enumerate(data[poe]["hz_cont_occ"])
-                    if hz != 0
-                ]
-                keys_to_filter.append("hz_cont_occ")
-            else:
-                valid_indices = [
-                    i for i, hz in enumerate(data[poe]["hz_cont_exc"])
-                    if hz != 0
-                ]
-            # Filter all relevant keys using valid indices
-            for key in keys_to_filter:
-                data[poe][key] = [data[poe][key][i] for i in valid_indices]
+    # Zero contribution bins are dropped while building the sparse results
+    _sparsify_disagg(disagg)
 
-        disagg["imt_disagg"][imt]["mag_dist_hazard_contributions"] = data
+    # Save the output dictionary as a JSON (or HDF5) file
+    if out_file is not None:
+        _save_output(out_file, disagg)
 
     return disagg
+
+
+def _sparsify_disagg(disagg: dict):
+    """Replaces the dense hazard contributions of each IMT by sparse
+    `MagDistContributions`
+    """
+    for imt in disagg["imt_disagg"]:
+        disagg["imt_disagg"][imt]["mag_dist_hazard_contributions"] = \
+            MagDistContributions.from_dense(
+                disagg["imt_disagg"][imt]["mag_dist_hazard_contributions"]
+            )
+
+
+class MagDistContributions(Mapping):
+    """Sparse magnitude-distance hazard contributions of an IMT
+
+    Only the bins with non-zero hazard contributions are stored, in a
+    coordinate (COO) layout: the magnitude and distance bin centres are
+    shared by all poes, while each poe holds the indices of its bins into
+    them and the values of each contribution type as typed arrays.
+
+    Accessing a poe, e.g. `contributions["poe_0.1"]`, returns a read-only
+    mapping of read-only arrays with the same keys as the dense results, i.e.
+    `mag`, `dist`, `hz_cont_exc`, `gamma` and `hz_cont_occ` (if available).
+    Since it is built on access, any modification would be lost, so that
+    they raise errors instead.
+
+    Parameters
+    ----------
+    mags : np.ndarray
+        Magnitude bin centres
+    dists : np.ndarray
+        Distance bin centres
+
+    Example
+    -------
+    >>> contributions = MagDistContributions.from_dense(
+        disagg["imt_disagg"]["SA(0.5)"]["mag_dist_hazard_contributions"]
+        )
+    >>> contributions["poe_0.1"]["hz_cont_exc"]
+    """
+
+    def __init__(self, mags: np.ndarray, dists: np.ndarray):
+        self.mags = np.asarray(mags, dtype=float)
+        self.dists = np.asarray(dists, dtype=float)
+        self.mag_idx = {}
+        self.dist_idx = {}
+        self.values = {}
+
+    def __getitem__(self, key: str) -> Mapping:
+        data = {
+            "mag": self.mags[self.mag_idx[key]],
+            "dist": self.dists[self.dist_idx[key]],
+            **self.values[key]
+        }
+        for values in data.values():
+            values.flags.writeable = False
+        return MappingProxyType(data)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @classmethod
+    def from_dense(cls, contributions: dict) -> 'MagDistContributions':
+        """Builds the sparse contributions from dense results, dropping the
+        bins with zero occurrence (if available) or exceedance contribution
+
+        Parameters
+        ----------
+        contributions : dict
+            Dense hazard contributions by poe, each containing `mag`, `dist`,
+            `hz_cont_exc`, `gamma` and optionally `hz_cont_occ`
+
+        Returns
+        -------
+        MagDistContributions
+            Sparse hazard contributions
+        """
+        dense = list(contributions.values())
+        if dense:
+            mags = np.unique(np.concatenate([c["mag"] for c in dense]))
+            dists = np.unique(np.concatenate([c["dist"] for c in dense]))
+        else:
+            mags, dists = [], []
+
+        sparse = cls(mags, dists)
+        idx_type = np.min_scalar_type(max(len(mags), len(dists)))
+
+        for key, data in contributions.items():
+            if "hz_cont_occ" in data:
+                nonzero = np.flatnonzero(np.asarray(data["hz_cont_occ"]) != 0)
+            else:
+                nonzero = np.flatnonzero(np.asarray(data["hz_cont_exc"]) != 0)
+
+            sparse.mag_idx[key] = np.searchsorted(
+                sparse.mags, np.asarray(data["mag"])[nonzero]
+            ).astype(idx_type)
+            sparse.dist_idx[key] = np.searchsorted(
+                sparse.dists, np.asarray(data["dist"])[nonzero]
+            ).astype(idx_type)
+            sparse.values[key] = {
+                name: np.asarray(values, dtype=float)[nonzero]
+                for name, values in data.items()
+                if name not in ["mag", "dist"]
+            }
+
+        return sparse
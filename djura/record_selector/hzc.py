@@ -1,17 +1,25 @@
 from pathlib import Path
+from functools import partial
 from typing import List
 import json
 import numpy as np
 
+from djura.utilities import map_parallel
+
 
 def prepare_rs_for_hzc(
     selection_dir: Path,
     poes: List[float],
     imts: List[str],
+    backend: str = None,
+    max_workers: int = None,
 ):
     """Prepare input Record selection intensity values for
     hazard consistency checks
 
+    Each records file is parsed once, and the intensity values of all IMTs
+    are gathered from it at once.
+
     Parameters
     ----------
     selection_dir : Path
@@ -21,17 +29,25 @@ def prepare_rs_for_hzc(
         List of POEs of interest
     imts : List[str]
         List of intensity measure types of interest
+    backend : str, optional
+        'process' or 'thread' to load the records files of the POEs
+        concurrently, by default None (files are loaded one after another).
+    max_workers : int, optional
+        Maximum number of workers when `backend` is provided.
 
     Returns
     -------
     Dict[numpy.ndarray]
         IM values of selected records
     """
+    intensities = map_parallel(
+        partial(_read_rs_intensities, selection_dir, imts), poes,
+        backend, max_workers
+    )
+
     rs = {}
-    for imi in imts:
-        rs[imi] = get_rs_imi_intensities(
-            selection_dir, poes, imi
-        )
+    for i, imi in enumerate(imts):
+        rs[imi] = np.asarray([imls[i] for imls in intensities])
     return rs
 
 
@@ -40,20 +56,35 @@ def get_rs_imi_intensities(
     poes: List[float],
     imi: str
 ):
-    imls = []
-    for poe in poes:
-        with open(selection_dir / f"records_{poe}.json") as f:
-            records = json.load(f)
-
-        records = records['selected_scaled_best']
-        if '(' in imi:
-            im_type = imi.split('(')[0]
-            period = float(imi.split('(')[1].split(')')[0])
-            period_idx = records['IMi'][im_type].index(period)
-            imi_idx = records['im_idxs'][im_type][period_idx]
-        else:
-            imi_idx = records['im_idxs'][imi]
-        imls.append(np.asarray(records['Scaled_IMs'])[:, imi_idx].flatten())
+    imls = [_read_rs_intensities(selection_dir, [imi], poe)[0]
+            for poe in poes]
 
     imls = np.asarray(imls)
     return imls
+
+
+def _read_rs_intensities(selection_dir: Path, imts: List[str],
+                         poe: float) -> np.ndarray:
+    """Reads the intensity values of the selected records of a POE for all
+    IMTs, (IMTs x records)
+    """
+    with open(Path(selection_dir) / f"records_{poe}.json") as f:
+        records = json.load(f)
+
+    records = records['selected_scaled_best']
+    idxs = [_get_imi_idx(records, imi) for imi in imts]
+
+    imls = np.asarray(records['Scaled_IMs'])[:, idxs]
+    return np.moveaxis(imls, 1, 0).reshape(len(imts), -1)
+
+
+def _get_imi_idx(records: dict, imi: str) -> int:
+    """Column of an IMT within the scaled IMs of the selected records
+    """
+    if '(' in imi:
+        im_type = imi.split('(')[0]
+        period = float(imi.split('(')[1].split(')')[0])
+        period_idx = records['IMi'][im_type].index(period)
+        return records['im_idxs'][im_type][period_idx]
+
+    return records['im_idxs'][imi]
@@ -0,0 +1,215 @@
+from pathlib import Path
+from typing import List, Union
+import json
+import numpy as np
+
+from djura.hazard.dstore import RuptureMatcher
+from djura.utilities import create_path, map_parallel, write_json
+
+
+def prepare_rs_input(
+    disagg: dict,
+    cond_imls: dict,
+    poes: List[float],
+    imts: List[str] = None,
+    ctx: dict = None,
+    n: int = None,
+    weight: str = "hz_cont_occ",
+    gmms: List[int] = (0,),
+    rake: float = 0.0,
+    site: int = 0,
+) -> dict:
+    """Prepare record selection input scenarios of all conditioning IMTs and
+    POEs from the disaggregation results
+
+    Parameters
+    ----------
+    disagg : dict
+        Disaggregation results, see
+        `djura.hazard.psha.proc_oq_disaggregation`
+    cond_imls : dict
+        Conditioning intensity levels of each IMT at the POEs, i.e.
+        `cond_imls` of `djura.hazard.psha.proc_oq_hazard_curve`. For
+        batched hazard outputs, (sites x poes) arrays, of which `site` is
+        used.
+    poes : List[float]
+        POEs of interest, in the order of `cond_imls`
+    imts : List[str], optional
+        Conditioning IMTs, by default all IMTs of the disaggregation with
+        conditioning intensity levels
+    ctx : dict, optional
+        Rupture contexts, see `djura.hazard.dstore.get_context_from_dstore`.
+        If provided, each scenario is matched to its closest rupture in
+        magnitude and Joyner-Boore distance, and the required parameters of
+        the GSIMs are taken from it.
+    n : int, optional
+        Number of most contributing scenarios to keep for each POE, by
+        default None (all scenarios). If 0, no scenarios are kept.
+    weight : str, optional
+        Hazard contributions used as scenario weights, 'hz_cont_occ' or
+        'hz_cont_exc', by default 'hz_cont_occ'
+    gmms : List[int], optional
+        IDs of the GMM sets assigned to the scenarios, by default [0]
+    rake : float, optional
+        Rake angle of the scenarios, by default 0.0
+    site : int, optional
+        Site index of batched `cond_imls`, by default 0
+
+    Returns
+    -------
+    dict
+        Record selection input of each IMT and POE, i.e. the `poes` entry of
+        the record selector input, with `ruptures` and `im-star`
+
+    Example
+    -------
+    >>> inputs = prepare_rs_input(disagg, hz['cond_imls'], poes, n=10)
+    >>> rs_input['poes'] = inputs['SA(0.5)']
+    """
+    if imts is None:
+        imts = [imt for imt in disagg["imt_disagg"] if imt in cond_imls]
+
+    matcher = None
+    if ctx is not None:
+        matcher = RuptureMatcher(ctx['ruptures'])
+        req_params = sorted(ctx['required-parameters'])
+
+    inputs = {}
+    for imt in imts:
+        contributions = disagg["imt_disagg"][imt][
+            "mag_dist_hazard_contributions"]
+
+        imls = np.asarray(cond_imls[imt], dtype=float)
+        if imls.ndim == 2:
+            imls = imls[site]
+
+        inputs[imt] = {}
+        for idx, poe in enumerate(poes):
+            data = contributions[f"poe_{poe}"]
+            weights = np.asarray(data[weight], dtype=float)
+            ids = _get_top_scenarios(weights, n)
+
+            columns = {
+                "ID": ids,
+                "rjb": np.asarray(data["dist"], dtype=float)[ids],
+                "mag": np.asarray(data["mag"], dtype=float)[ids],
+                "rake": np.full(len(ids), rake),
+                "weight": weights[ids],
+            }
+
+            if matcher is not None:
+                matched = matcher.query(
+                    {"mag": columns["mag"], "rjb": columns["rjb"]},
+                    req_params
+                )
+                columns.update(
+                    {param: matched[param] for param in req_params})
+
+            inputs[imt][poe] = {
+                "ruptures": _get_records(columns, gmms),
+                "im-star": {"type": imt, "value": float(imls[idx])},
+            }
+
+    return inputs
+
+
+def _get_top_scenarios(weights: np.ndarray, n: int = None) -> np.ndarray:
+    """Indices of the `n` largest weights, in descending order of weight,
+    or of all weights in their original order if `n` is None
+    """
+    if n is None:
+        return np.arange(len(weights))
+
+    if n < 0:
+        raise ValueError(f"Number of scenarios must not be negative, got {n}!")
+    if n == 0:
+        return np.empty(0, dtype=int)
+
+    if n >= len(weights):
+        ids = np.arange(len(weights))
+    else:
+        ids = np.sort(np.argpartition(weights, len(weights) - n)[-n:])
+
+    # Stable sort, ties keep the order of the scenarios
+    return ids[np.argsort(-weights[ids], kind="stable")]
+
+
+def _get_records(columns: dict, gmms: List[int]) -> List[dict]:
+    """Builds the scenario records from columnar arrays
+    """
+    names = list(columns)
+    rows = zip(*(np.asarray(values).tolist() for values in columns.values()))
+    return [
+        {**dict(zip(names, row)), "gmms": list(gmms)} for row in rows
+    ]
+
+
+def split_rs_input(
+    input_file: Union[str, Path],
+    out_dir: Union[str, Path] = None,
+    indent: int = None,
+    backend: str = "thread",
+    max_workers: int = None,
+) -> List[Path]:
+    """Split a record selection input of multiple POEs into one input file
+    per POE
+
+    The input file is read once. Each output file holds the fields shared by
+    all POEs and the `ruptures` and `im-star` of its POE only, and is named
+    after the input file and the POE, e.g. `SA(0.59)_0.1.json`.
+
+    Parameters
+    ----------
+    input_file : Union[str, Path]
+        Record selection input JSON file with a `poes` entry, e.g. as built
+        with `prepare_rs_input`
+    out_dir : Union[str, Path], optional
+        Directory of the output files, by default the directory of the input
+        file
+    indent : int, optional
+        Indentation of the output files, by default None (compact)
+    backend : str, optional
+        'process' or 'thread' to write the files concurrently, by default
+        'thread'. If None, the files are written one after another.
+    max_workers : int, optional
+        Maximum number of workers when `backend` is provided.
+
+    Returns
+    -------
+    List[Path]
+        Paths of the output files, in the order of the POEs
+
+    Example
+    -------
+    >>> split_rs_input('data/SA(0.59).json', 'data/poes')
+    """
+    input_file = Path(input_file)
+    out_dir = input_file.parent if out_dir is None else Path(out_dir)
+    create_path(out_dir)
+
+    with open(input_file) as f:
+        data = json.load(f)
+
+    poes = data.pop("poes")
+    # The scenarios of each POE replace any top level ones
+    data.pop("ruptures", None)
+    data.pop("im-star", None)
+
+    items = [
+        (out_dir / f"{input_file.stem}_{poe}.json", data, poe_data, indent)
+        for poe, poe_data in poes.items()
+    ]
+    map_parallel(_write_poe_input, items, backend, max_workers)
+
+    return [item[0] for item in items]
+
+
+def _write_poe_input(item: tuple):
+    """Writes the input file of a POE, see `split_rs_input`
+    """
+    file, shared, poe_data, indent = item
+    write_json(file, {
+        **shared,
+        "ruptures": poe_data["ruptures"],
+        "im-star": poe_data["im-star"],
+    }, indent)
@@ -1,15 +1,19 @@
 from pathlib import Path
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, IO, Union
 import re
 import shutil
 import pickle
 import json
+import h5py
 import numpy as np
 
 
 def to_json_serializable(data):
-    if isinstance(data, dict):
-        for key, value in data.items():
-            data[key] = to_json_serializable(value)
+    if isinstance(data, Mapping):
+        return {key: to_json_serializable(value)
+                for key, value in data.items()}
     elif isinstance(data, list):
         return [to_json_serializable(item) for item in data]
     elif isinstance(data, np.ndarray):
@@ -22,6 +26,132 @@ def to_json_serializable(data):
     return data
 
 
+class NumpyJSONEncoder(json.JSONEncoder):
+    """JSON encoder of NumPy arrays and scalars, and of any mapping
+
+    Arrays are converted one at a time while encoding, so that no
+    serialisable copy of the whole data is made.
+    """
+
+    def default(self, o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        elif isinstance(o, np.integer):
+            return int(o)
+        elif isinstance(o, np.floating):
+            return float(o)
+        elif isinstance(o, np.bool_):
+            return bool(o)
+        elif isinstance(o, Mapping):
+            return dict(o)
+
+        return super().default(o)
+
+
+def write_json(file: Union[str, Path, IO], data, indent: int = None,
+               chunk_size: int = 1 << 16):
+    """Writes data to a JSON file incrementally
+
+    The data is encoded with `NumpyJSONEncoder` and streamed to the file in
+    chunks as it is encoded, instead of being serialised in one go.
+
+    Parameters
+    ----------
+    file : Union[str, Path, IO]
+        Path of the JSON file, or a writable text file-like object
+    data : any
+        Data to be stored, may contain NumPy arrays and scalars
+    indent : int, optional
+        Indentation of the JSON file, by default None (compact)
+    chunk_size : int, optional
+        Number of characters buffered before each write, by default 65536
+
+    Usage
+    ------
+    >>> write_json('rs_input.json', rs_input)
+    """
+    if not hasattr(file, "write"):
+        with open(file, "w") as f:
+            write_json(f, data, indent, chunk_size)
+        return
+
+    buffer, size = [], 0
+    for chunk in NumpyJSONEncoder(indent=indent).iterencode(data):
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size:
+            file.write("".join(buffer))
+            buffer, size = [], 0
+    file.write("".join(buffer))
+
+
+def map_parallel(
+    func: Callable,
+    items: Iterable,
+    backend: str = None,
+    max_workers: int = None
+) -> list:
+    """Applies a function to each item, optionally using a pool of workers
+
+    Parameters
+    ----------
+    func : Callable
+        Function to apply, must be picklable (i.e. defined at module level)
+        for the 'process' backend
+    items : Iterable
+        Items to process
+    backend : str, optional
+        'process' or 'thread' to use a pool of workers, by default None
+        (serial execution)
+    max_workers : int, optional
+        Maximum number of workers of the pool, by default None (as decided by
+        concurrent.futures)
+
+    Returns
+    -------
+    list
+        Results in the same order as the items
+    """
+    items = list(items)
+
+    if backend is None:
+        return [func(item) for item in items]
+
+    if backend == "process":
+        executor = ProcessPoolExecutor
+    elif backend == "thread":
+        executor = ThreadPoolExecutor
+    else:
+        raise ValueError(f"Backend {backend} not supported, use 'process' or "
+                         "'thread'!")
+
+    with executor(max_workers=max_workers) as pool:
+        return list(pool.map(func, items))
+
+
+def map_jobs(func: Callable, items: Iterable, n_jobs: int = None) -> list:
+    """Applies a function to each item, using a pool of `n_jobs` worker
+    processes if more than one, see `map_parallel`
+
+    Parameters
+    ----------
+    func : Callable
+        Function to apply, must be picklable (i.e. defined at module level)
+    items : Iterable
+        Items to process
+    n_jobs : int, optional
+        Number of worker processes. If None or 1, the items are processed
+        serially.
+
+    Returns
+    -------
+    list
+        Results in the same order as the items
+    """
+    backend = "process" if n_jobs is not None and n_jobs > 1 else None
+    return map_parallel(func, items, backend, n_jobs)
+
+
 def get_period_im(name: str):
     """Given name of intensity measure (IM)
     return IM type and associated period (if available)
@@ -72,21 +202,113 @@ def export_results(filepath: Path, data, filetype: str):
     data : any
         Data to be stored
     filetype : str
-        Filetype, e.g. npy, json, pkl, csv
+        Filetype, e.g. npy, json, pkl, csv, hdf5
     """
-    if filetype == "json":
-        data = to_json_serializable(data)
-
     if filetype == "npy":
         np.save(f"{filepath}.npy", data)
     elif filetype == "pkl" or filetype == "pickle":
         with open(f"{filepath}.pickle", 'wb') as handle:
             pickle.dump(data, handle)
     elif filetype == "json":
-        with open(f"{filepath}.json", "w") as json_file:
-            json.dump(data, json_file)
+        write_json(f"{filepath}.json", data)
     elif filetype == "csv":
         data.to_csv(f"{filepath}.csv", index=False)
+    elif filetype == "hdf5":
+        write_hdf5(f"{filepath}.hdf5", data)
+
+
+def write_hdf5(filepath: Path, data: Mapping):
+    """Writes (nested) results to a binary HDF5 file
+
+    Each nested dictionary is stored as a group, e.g. one group per IMT and
+    per poe, and each numerical array or list as a contiguous dataset, so
+    that it can be memory mapped when reading it back with `read_hdf5`.
+    Strings and scalars are stored as attributes of their group.
+
+    Parameters
+    ----------
+    filepath : Path
+        Path of the HDF5 file
+    data : Mapping
+        Data to be stored
+    """
+    with h5py.File(filepath, "w") as f:
+        _write_hdf5_group(f, data)
+
+
+def _write_hdf5_group(group: h5py.Group, data: Mapping):
+    for key, value in data.items():
+        key = str(key)
+        if isinstance(value, Mapping):
+            _write_hdf5_group(group.create_group(key), value)
+        elif value is None:
+            group.attrs[key] = h5py.Empty("f8")
+        elif isinstance(value, (str, int, float, np.generic)):
+            group.attrs[key] = value
+        elif len(value) and isinstance(value[0], str):
+            group.create_dataset(key, data=list(value),
+                                 dtype=h5py.string_dtype())
+        else:
+            group.create_dataset(key, data=np.asarray(value))
+
+
+def read_hdf5(filepath: Path, key: str = None):
+    """Reads results written by `write_hdf5` lazily
+
+    Numerical datasets are memory mapped, so that only the slices being
+    accessed are read from disk.
+
+    Parameters
+    ----------
+    filepath : Path
+        Path of the HDF5 file
+    key : str, optional
+        Path of a group or dataset within the file to read, e.g.
+        "imt_disagg/SA(0.5)/mag_dist_hazard_contributions/poe_0.1", by
+        default None (the whole file)
+
+    Returns
+    -------
+    dict | np.ndarray | list
+        Nested dictionary of memory mapped arrays and attributes if `key`
+        is a group, otherwise the (memory mapped) dataset
+
+    Usage
+    ------
+    >>> poe = read_hdf5('disaggregation.hdf5',
+                        'imt_disagg/SA(0.5)/mag_dist_hazard_contributions')
+    >>> poe['poe_0.1']['hz_cont_occ'][:10]
+    """
+    with h5py.File(filepath, "r") as f:
+        item = f if key is None else f[key]
+        if isinstance(item, h5py.Group):
+            return _read_hdf5_group(filepath, item)
+        return _read_hdf5_dataset(filepath, item)
+
+
+def _read_hdf5_group(filepath: Path, group: h5py.Group) -> dict:
+    data = {}
+    for key, value in group.attrs.items():
+        data[key] = None if isinstance(value, h5py.Empty) else value
+    for key, item in group.items():
+        if isinstance(item, h5py.Group):
+            data[key] = _read_hdf5_group(filepath, item)
+        else:
+            data[key] = _read_hdf5_dataset(filepath, item)
+    return data
+
+
+def _read_hdf5_dataset(filepath: Path, dataset: h5py.Dataset):
+    if h5py.check_string_dtype(dataset.dtype) is not None:
+        return dataset.asstr()[()].tolist()
+
+    offset = dataset.id.get_offset()
+    if offset is None or dataset.chunks is not None:
+        # Empty or chunked datasets cannot be memory mapped
+        return dataset[()]
+
+    return np.memmap(filepath, mode="r", dtype=dataset.dtype,
+                     shape=dataset.shape, offset=offset)
 
 
 def remove_path(directory: Path):
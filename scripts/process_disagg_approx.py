@@ -14,6 +14,7 @@ path = Path(__file__).resolve().parent
 sys.path.insert(0, str(path.parent))
 
 from djura.hazard.psha import proc_oq_disaggregation, proc_oq_hazard_curve
+from djura.record_selector.inputs import prepare_rs_input
 
 
 # POEs of interest
@@ -32,8 +33,6 @@ hz = proc_oq_hazard_curve(poes, path / 'data/psha')
 # SA(0.5) to be used as conditional IM
 imt = "SA(0.5)"
 
-imls = hz['cond_imls'][imt]
-
 rs_input = json.load(open(path / "data/djura-conditional-all-input.json"))
 rs_input["imi"] = [
     'SA(0.05)', 'SA(0.075)', 'SA(0.1)', 'SA(0.15)', 'SA(0.2)',
@@ -52,33 +51,18 @@ rs_input["site-parameters"] = {
     "xvf": "150",
     "region": 0
 }
-rs_input["poes"] = {}
 
-for idx, poe in enumerate(poes):
-    disagg = disagg_all["imt_disagg"][imt][
-        'mag_dist_hazard_contributions'][f'poe_{poe}']
-    ruptures = []
-    for i in range(len(disagg['mag'])):
-        ruptures.append(
-            {
-                "ID": i,
-                "gmms": [0],
-                "rjb": disagg['dist'][i],
-                "mag": disagg['mag'][i],
-                "rake": 0.0,
-                "weight": disagg['hz_cont_occ'][i],
-                # "weight": disagg['hz_cont_exc'][i],
-            }
-        )
-    rs_input["poes"][poe] = {
-        "ruptures": ruptures,
-        "im-star": {"type": imt, "value": imls[idx]},
-    }
-    # You may save the rs_input variable to a file for each POE
-    # This input then may be directly uploaded in 
-    # https://apps.djura.it/hazard/record-selector/conditional
+# Scenarios and conditioning IML of each POE
+rs_input["poes"] = prepare_rs_input(
+    disagg_all, hz['cond_imls'], poes, imts=[imt],
+    # weight='hz_cont_exc',
+)[imt]
+
+# You may save the rs_input variable to a file for each POE
+# This input then may be directly uploaded in 
+# https://apps.djura.it/hazard/record-selector/conditional
 
-    # NOTE: however, be careful as browsers might not easily display
-    # large amount of data
-    # If you encounter issues, feel free to contact us for questions
-    # or to help run the API without a UI
+# NOTE: however, be careful as browsers might not easily display
+# large amount of data
+# If you encounter issues, feel free to contact us for questions
+# or to help run the API without a UI
@@ -8,8 +8,6 @@ This is an approximate approach
 from pathlib import Path
 import sys
 import json
-import heapq
-import numpy as np
 
 path = Path(__file__).resolve().parent
 
@@ -17,6 +15,8 @@ sys.path.insert(0, str(path.parent))
 
 from djura.hazard.dstore import get_context_from_dstore
 from djura.hazard.psha import proc_oq_disaggregation, proc_oq_hazard_curve
+from djura.record_selector.inputs import prepare_rs_input
+from djura.utilities import write_json
 
 # POEs of interest
 # Those are probability of exceedances (POEs) associated with intensity levels
@@ -34,8 +34,6 @@ hz = proc_oq_hazard_curve(poes, path / 'data/psha')
 # SA(0.5) to be used as conditional IM
 imt = "SA(0.5)"
 
-imls = hz['cond_imls'][imt]
-
 rs_input = json.load(open(path / "data/djura-conditional-all-input.json"))
 
 # Some of the following input parameters are taken from the job.ini file
@@ -57,47 +55,6 @@ rs_input["site-parameters"] = {
     "xvf": "150",
     "region": 0
 }
-rs_input["poes"] = {}
-
-for idx, poe in enumerate(poes):
-    disagg = disagg_all["imt_disagg"][imt][
-        'mag_dist_hazard_contributions'][f'poe_{poe}']
-    ruptures = []
-    for i in range(len(disagg['mag'])):
-        ruptures.append(
-            {
-                "ID": i,
-                "gmms": [0],
-                "rjb": disagg['dist'][i],
-                "mag": disagg['mag'][i],
-                "rake": 0.0,
-                "weight": disagg['hz_cont_occ'][i],
-                # "weight": disagg['hz_cont_exc'][i],
-            }
-        )
-    rs_input["poes"][poe] = {
-        "ruptures": ruptures,
-        "im-star": {"type": imt, "value": imls[idx]},
-    }
-    # You may save the rs_input variable to a file for each POE
-    # This input then may be directly uploaded in
-    # https://apps.djura.it/hazard/record-selector/conditional
-
-    # NOTE: however, be careful as browsers might not easily display
-    # large amount of data
-    # If you encounter issues, feel free to contact us for questions
-    # or to help run the API without a UI
-
-# Most contributing scenarios to select
-# Leave None for all
-n = 10
-if n is not None:
-    for poe in poes:
-        ruptures = rs_input['poes'][poe]['ruptures']
-
-        # select the most contributing scenarios (unsorted)
-        ruptures = heapq.nlargest(n, ruptures, key=lambda x: x['weight'])
-        rs_input['poes'][poe]['ruptures'] = ruptures
 
 # Match the mag and rjb to required parameters
 # Get datastore
@@ -107,68 +64,33 @@ ctx, oq = get_context_from_dstore(hdf_path, im_ref=imt)
 
 site_params = {}
 
-# Based on OQ assignment
-params = np.rec.array(np.concatenate(list(ctx['ctx_by_grp'].values())))
+# Based on OQ assignment, rupture table of all groups
+params = ctx['ruptures']
 
 for param in ctx['site-parameters']:
     site_params[param] = params[param][0]
 rs_input['site-parameters'] = site_params
 
-for poe in poes:
-    ruptures = rs_input["poes"][poe]['ruptures']
-    for i, rup in enumerate(ruptures):
-        mag = rup['mag']
-        rjb = rup['rjb']
-        print(f"Target Magnitude: {mag}, and Rjb: {rjb}")
-
-        # Euclidean distance for each recarray row
-        mag_normalized = (params['mag'] - params['mag'].min()) / \
-            (params['mag'].max() - params['mag'].min())
-        rjb_normalized = (params['rjb'] - params['rjb'].min()) / \
-            (params['rjb'].max() - params['rjb'].min())
-
-        target_mag_norm = (mag - params['mag'].min()) / \
-            (params['mag'].max() - params['mag'].min())
-        target_rjb_norm = (rjb - params['rjb'].min()) / \
-            (params['rjb'].max() - params['rjb'].min())
-
-        distances = np.sqrt((mag_normalized - target_mag_norm) **
-                            2 + (rjb_normalized - target_rjb_norm)**2)
-
-        closest_idx = np.argmin(distances)
-        closest_row = params[closest_idx]
-
-        print(f"Closest mag: {closest_row['mag']}")
-        print(f"Closest rjb: {closest_row['rjb']}")
-
-        # Required parameters
-        req_params = ctx['required-parameters']
-        req_params_values = {}
-        for param in req_params:
-            req_params_values[param] = closest_row[param]
-
-        rs_input["poes"][poe]['ruptures'][i] = {
-            **rs_input["poes"][poe]['ruptures'][i], **req_params_values}
-
-
-def to_json_serializable(data):
-    from numpy import float32, int32, ndarray
-
-    if isinstance(data, dict):
-        for key, value in data.items():
-            data[key] = to_json_serializable(value)
-    elif isinstance(data, list):
-        return [to_json_serializable(item) for item in data]
-    elif isinstance(data, ndarray):
-        return data.tolist()
-    elif isinstance(data, float32):
-        return float(data)
-    elif isinstance(data, int32):
-        return float(data)
-
-    return data
-
+# Most contributing scenarios to select
+# Leave None for all
+n = 10
 
-rs_input = to_json_serializable(rs_input)
-with open("filename.json", "w") as json_file:
-    json.dump(rs_input['num-components'], json_file)
+# Scenarios and conditioning IML of each POE, each scenario is matched to
+# the closest rupture of the datastore in mag and rjb to get the required
+# parameters of the GSIMs
+rs_input["poes"] = prepare_rs_input(
+    disagg_all, hz['cond_imls'], poes, imts=[imt], ctx=ctx, n=n,
+    # weight='hz_cont_exc',
+)[imt]
+
+# You may save the rs_input variable to a file for each POE
+# This input then may be directly uploaded in
+# https://apps.djura.it/hazard/record-selector/conditional
+
+# NOTE: however, be careful as browsers might not easily display
+# large amount of data
+# If you encounter issues, feel free to contact us for questions
+# or to help run the API without a UI
+
+# Arrays and NumPy scalars are streamed to the file as they are encoded
+write_json(path / "filename.json", rs_input)
@@ -21,6 +21,7 @@ path = Path(__file__).resolve().parent
 sys.path.insert(0, str(path.parent))
 
 from djura.hazard.dstore import get_context_from_dstore
+from djura.hazard.contexts import get_disaggregation_from_contexts
 
 
 # OQ Datastores (.hdf5) are typically located in:
@@ -35,11 +36,13 @@ dstore = "85"
 hdf_path = path.parents[5] / f"oqdata/calc_{dstore}.hdf5"
 ctx, oq = get_context_from_dstore(hdf_path, im_ref=im_ref)
 
-# You may choose to save the context into a pickle
-# from djura.utilities import export_results
-
-# export_results(
-#     path / f"ctx_{dstore}",
-#     ctx,
-#     "pickle"
+# Contexts can be cached to skip re-processing the datastore on later runs
+# ctx, oq = get_context_from_dstore(
+#     hdf_path, im_ref=im_ref, cache_dir=path / "cache"
 # )
+
+# Exact disaggregation on the conditional IM at the IMLs of the hazard
+# model, per rupture and binned by magnitude and distance
+imls = ctx['imt'][im_ref]
+disagg = get_disaggregation_from_contexts(ctx, imls, im_ref=im_ref)
+print(disagg['mag_dist']['mean_mags'], disagg['mag_dist']['mean_dists'])
@@ -1,26 +1,19 @@
-import json
+# flake8: noqa
 from pathlib import Path
+import sys
 
-path = Path(__file__).parent
-imt = "SA(0.59)"
-
-# Load JSON as a Python dict
-with open(path / f"data/{imt}.json", "r") as f:
-    data = json.load(f)
+path = Path(__file__).resolve().parent
 
-poes = data['poes']
+sys.path.insert(0, str(path.parent))
 
-for poe in poes:
-    _data = data.copy()
+from djura.record_selector.inputs import split_rs_input
 
-    ruptures = data['poes'][str(poe)]['ruptures']
-    im_star = data['poes'][str(poe)]['im-star']  # adjust if key name differs
-
-    _data['ruptures'] = ruptures
-    _data['im-star'] = im_star
+imt = "SA(0.59)"
 
-    output_file = path / f"{imt}_{poe}.json"
-    # with open(output_file, 'w') as f_out:
-    #     json.dump(_data, f_out, indent=4)
+# One input file per POE, holding the shared fields and the ruptures and
+# im-star of the POE only, written concurrently
+files = split_rs_input(path / f"data/{imt}.json", path / "data/poes",
+                       indent=4)
 
-    # print(f"Saved {output_file}")
+for file in files:
+    print(f"Saved {file}")